@@ -0,0 +1,162 @@
+import io
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+# END-TO-END THROUGHPUT BENCHMARK FOR THE v4 / cli.py SEND PATH AGAINST A LOCAL MOCK PROVIDER
+#   python bench.py --sizes 100 1000 10000 --latency-ms 20 --output bench_results.json
+# results are appended to the output file as one JSON object per run
+
+SUBJECTS = 12
+
+# SYNTHETIC ROSTER ('sem 1') AND MARKS ('IA 1') WORKBOOKS
+def make_workbooks(directory, students):
+    usns = [f"1XX{i:05d}" for i in range(students)]
+    roster = pd.DataFrame({
+        "USN": usns,
+        "Student Name": [f"Student {i}" for i in range(students)],
+        "Phone Number": np.arange(9000000000, 9000000000 + students),
+    })
+    marks = pd.DataFrame({"USN": usns})
+    for j in range(SUBJECTS):
+        marks[f"Subject {j + 1}"] = np.random.randint(0, 51, students)
+
+    students_file = os.path.join(directory, f"students_{students}.xlsx")
+    marks_file = os.path.join(directory, f"marks_{students}.xlsx")
+    with pd.ExcelWriter(students_file) as writer:
+        roster.to_excel(writer, sheet_name="sem 1", index=False)
+    with pd.ExcelWriter(marks_file) as writer:
+        marks.to_excel(writer, sheet_name="IA 1", index=False)
+    return students_file, marks_file
+
+# AN IN-MEMORY UPLOADED IMAGE (name / type attributes like st.file_uploader's)
+def upload(data, name, type):
+    image = io.BytesIO(data)
+    image.name = name
+    image.type = type
+    return image
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+# WAIT FOR THE OUTBOX WORKER TO FINISH A BATCH, THEN SUMMARIZE IT
+def measure(app, flow, size, batch_ids, start, timeout):
+    outbox = app.get_outbox()
+    while True:
+        progress = [outbox.progress(batch_id) for batch_id in batch_ids]
+        if all(p["done"] for p in progress) or time.perf_counter() - start > timeout:
+            break
+        time.sleep(0.05)
+    seconds = time.perf_counter() - start
+    latencies = [value for batch_id in batch_ids for value in outbox.latencies(batch_id)]
+    sent = sum(p["sent"] for p in progress)
+    return {
+        "flow": flow,
+        "students": size,
+        "messages": sum(p["total"] for p in progress),
+        "sent": sent,
+        "failed": sum(p["failed"] for p in progress),
+        "seconds": round(seconds, 3),
+        "messages_per_sec": round(sent / seconds, 1) if seconds else None,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run(args):
+    from mock_provider import MockProvider
+
+    mock = MockProvider(args.latency_ms / 1000, args.error_rate, args.throttle_rate, args.retry_after).start()
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    # provider settings are read at import time, so configure before importing the app
+    os.environ.update({
+        "WASSENGER_API": "bench",
+        "WASSENGER_URL": mock.url + "/v1",
+        "HYPERSENDER_URL": mock.url + "/api/whatsapp/v1",
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "ROSTER_CACHE_DIR": os.path.join(workdir, "roster_cache"),
+        "DATA_DIRS": workdir,
+        "MAX_IN_FLIGHT": str(args.max_in_flight),
+        "PROVIDER_RATE": str(args.rate),
+        "PROVIDER_MAX_RATE": str(args.rate),
+        "PROVIDER_BURST": str(args.rate),
+        # bulk pacing at the provider rate, so the bench measures the send path
+        "BULK_RATE": str(args.rate),
+    })
+    import messaging as app
+    app.get_worker()
+
+    results = []
+    for size in args.sizes:
+        students_file, marks_file = make_workbooks(workdir, size)
+
+        start = time.perf_counter()
+        pd.read_excel(students_file, sheet_name=None)
+        pd.read_excel(marks_file, sheet_name=None)
+        parse_seconds = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        batch_id = app.send_ia_marks(students_file, marks_file, 1, resend=True)
+        result = measure(app, "send_ia_marks", size, [batch_id], start, args.timeout)
+        result["parse_seconds"] = parse_seconds
+        results.append(result)
+
+        image = upload(os.urandom(200 * 1024), f"circular_{size}.jpg", "image/jpeg")
+        start = time.perf_counter()
+        batch_id = app.send_whatsapp_image(students_file, image, resend=True)
+        results.append(measure(app, "send_whatsapp_image", size, [batch_id], start, args.timeout))
+
+        singles = min(size, args.single_messages)
+        start = time.perf_counter()
+        batch_ids = [
+            app.message_student(students_file, f"Bench message {time.time()}", 1, student_usn=f"1XX{i:05d}")
+            for i in range(singles)
+        ]
+        results.append(measure(app, "message_student", size, batch_ids, start, args.timeout))
+
+        for result in results[-3:]:
+            print(json.dumps(result))
+
+    mock.stop()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "throttle_rate": args.throttle_rate,
+            "max_in_flight": args.max_in_flight,
+            "rate": args.rate,
+        },
+        "mock_counts": mock.counts,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark against a local mock provider")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000, help="provider rate limit, messages/sec")
+    parser.add_argument("--single-messages", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(report) + "\n")
+    print(f"Results appended to {args.output}")
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# COLD START BENCHMARK: IMPORT TIME OF EACH ENTRY POINT IN A FRESH INTERPRETER
+#   python bench_startup.py --runs 5 --output startup_results.json
+# results are appended to the output file as one JSON object per run; the exit
+# status is 1 when an entry point is over its budget or imports an optional backend
+
+# entry point module -> import-time budget in milliseconds
+BUDGETS = {
+    "cli": 100,
+    "messaging": 1000,
+    "v4": 1500,
+    "v1_0": 1500,
+    "v2_0": 1500,
+}
+# backends that must only load when a send actually goes through them
+OPTIONAL = ["pywhatkit", "twilio", "pywa", "openpyxl", "selenium", "PIL"]
+# slowest direct imports reported per entry point
+TOP_N = 5
+
+# ONE FRESH INTERPRETER IMPORTING module: (import ms, {direct import: ms}, loaded optional backends)
+def measure(module):
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total = None
+    children = {}
+    # "import time: self [us] | cumulative | imported package", nesting shown by
+    # indentation and a package listed after everything it imported
+    pending = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1000
+            children = pending
+        elif depth == 0:
+            pending = {}
+        elif depth == 1:
+            pending[name.strip()] = int(cumulative) / 1000
+    loaded = set(json.loads(result.stdout.splitlines()[-1]))
+    return total, children, sorted(name for name in OPTIONAL if name in loaded)
+
+def run(args):
+    scale = args.budget_scale
+    results = []
+    for module, budget in BUDGETS.items():
+        if args.only and module not in args.only:
+            continue
+        runs = [measure(module) for _ in range(args.runs)]
+        times = [total for total, _, _ in runs]
+        # direct imports of the median run, slowest first
+        _, children, optional = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+        result = {
+            "module": module,
+            "median_ms": round(statistics.median(times), 1),
+            "min_ms": round(min(times), 1),
+            "budget_ms": budget * scale,
+            "optional_loaded": optional,
+            "slowest_imports": {
+                name: round(ms, 1) for name, ms in sorted(children.items(), key=lambda item: item[1], reverse=True)[:TOP_N]
+            },
+        }
+        result["ok"] = result["median_ms"] <= result["budget_ms"] and not optional
+        print(json.dumps(result))
+        results.append(result)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget check for the app and CLI entry points")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=list(BUDGETS), help="entry points to measure, all by default")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiply every budget, for slow machines")
+    parser.add_argument("--output", default="startup_results.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(report) + "\n")
+    print(f"Results appended to {args.output}")
+    sys.exit(0 if all(result["ok"] for result in report["results"]) else 1)
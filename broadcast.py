@@ -0,0 +1,42 @@
+import pandas as pd
+from phones import preflight
+from templates import LANGUAGE_COLUMN
+
+# ONE MESSAGE TO THE PARENTS OF SEVERAL SEMESTERS: THE SELECTED SHEETS ARE
+# UNIONED AND EVERY PARENT PHONE IS MESSAGED ONCE, BEFORE ANY NETWORK CALL
+
+# RECIPIENTS OF ONE BROADCAST
+# frames maps semester number -> roster sheet with a 'Phone Number' column
+class BroadcastPlan:
+    def __init__(self, frames):
+        parts = []
+        problems = []
+        for number, frame in frames.items():
+            valid, report = preflight(frame)
+            part = pd.DataFrame({"phone": valid["Phone Number"], "semester": number})
+            if LANGUAGE_COLUMN in valid.columns:
+                part[LANGUAGE_COLUMN] = valid[LANGUAGE_COLUMN]
+            parts.append(part)
+            problems.append(report.assign(semester=number))
+        combined = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["phone", "semester"])
+        self.semesters = list(frames)
+        self.rows = sum(len(frame) for frame in frames.values())
+        # rows left out because of a missing or invalid number, by sheet row
+        self.problems = pd.concat(problems, ignore_index=True) if problems else pd.DataFrame(columns=["row", "value", "problem", "semester"])
+        self.invalid = len(self.problems)
+        # first occurrence wins, so recipients keep the sheets' order
+        # recipients: one row per phone, with the parent's language when the sheets have one
+        self.recipients = combined.drop_duplicates("phone").reset_index(drop=True)
+        self.phones = self.recipients["phone"].tolist()
+        self.duplicates = len(combined) - len(self.phones)
+
+    def __len__(self):
+        return len(self.phones)
+
+    def summary(self):
+        text = f"{len(self.phones)} parents across {len(self.semesters)} semester(s)"
+        if self.duplicates:
+            text += f", {self.duplicates} duplicate number(s) merged"
+        if self.invalid:
+            text += f", {self.invalid} row(s) without a valid phone number"
+        return text
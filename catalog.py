@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+
+# DIRECTORIES SEARCHED FOR WORKBOOKS (os.pathsep SEPARATED), DEFAULT: WORKING DIRECTORY
+DATA_DIRS = [d for d in os.environ.get("DATA_DIRS", ".").split(os.pathsep) if d]
+# SECONDS BETWEEN CHECKS FOR NEW, CHANGED OR REMOVED FILES
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", 5))
+EXTENSIONS = (".xlsx",)
+
+# INCREMENTAL LIST OF WORKBOOKS UNDER THE DATA DIRECTORIES
+# a refresh stats every known directory and only re-lists the ones whose
+# mtime changed, instead of walking the whole tree on every rerun
+class FileCatalog:
+    def __init__(self, roots=DATA_DIRS, ttl=CATALOG_TTL):
+        self.roots = [os.path.normpath(root) for root in roots]
+        self.ttl = ttl
+        self.dirs = {}
+        self.details = {}
+        self.last_refresh = 0.0
+        self.lock = threading.Lock()
+
+    def paths(self):
+        with self.lock:
+            if time.monotonic() - self.last_refresh >= self.ttl:
+                self._refresh()
+                self.last_refresh = time.monotonic()
+            return sorted(path for _, files, _ in self.dirs.values() for path in files)
+
+    def _refresh(self):
+        seen = set()
+        pending = [root for root in self.roots if os.path.isdir(root)]
+        while pending:
+            directory = pending.pop()
+            seen.add(directory)
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            cached = self.dirs.get(directory)
+            if cached is None or cached[0] != mtime:
+                cached = self._list(directory, mtime)
+                self.dirs[directory] = cached
+            pending.extend(cached[2])
+        for directory in set(self.dirs) - seen:
+            del self.dirs[directory]
+
+    # ONE LEVEL OF A DIRECTORY: (mtime, workbook paths, subdirectories)
+    def _list(self, directory, mtime):
+        files, subdirs = [], []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return mtime, files, subdirs
+        for entry in entries:
+            # hidden directories (.git, caches) and Excel lock files are skipped
+            if entry.name.startswith((".", "~$")):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(os.path.normpath(entry.path))
+            elif entry.name.lower().endswith(EXTENSIONS):
+                files.append(os.path.normpath(entry.path))
+        return mtime, files, subdirs
+
+    # SHEET NAMES AND ROW COUNTS, READ FROM THE WORKBOOK'S SHEET DIMENSIONS
+    # (no cell data is parsed) and cached until the file changes
+    def describe(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {}
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if key in self.details:
+                return self.details[key]
+        try:
+            from openpyxl import load_workbook
+            workbook = load_workbook(path, read_only=True)
+            sheets = {sheet.title: max((sheet.max_row or 1) - 1, 0) for sheet in workbook.worksheets}
+            workbook.close()
+        except Exception:
+            sheets = {}
+        with self.lock:
+            self.details = {k: v for k, v in self.details.items() if k[0] != path}
+            self.details[key] = sheets
+        return sheets
@@ -0,0 +1,119 @@
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+# HEADLESS BATCH SENDS FOR CRON JOBS AND SCRIPTS, STREAMLIT IS NEVER IMPORTED
+#   python cli.py ia --students sem5.xlsx --marks sem5_marks.xlsx --semester 5 --ia 1
+#   python cli.py circular --students all.xlsx --image circular.jpg --semester 1 3 5
+#   python cli.py message --students sem5.xlsx --semester 5 --usn 1XX21CS001 --message "..."
+# every event is printed as one JSON object per line: rows left out by the phone
+# check, the queued batch, each message as it finishes and a final summary
+# exit status: 0 all sent, 1 some messages failed or --timeout passed, 2 nothing queued
+
+# seconds between outbox polls while following a batch
+FOLLOW_INTERVAL = 0.5
+# messages are stamped just before the worker writes them, so each poll looks
+# back this far to not miss a slow write; already printed messages are skipped
+LOOKBACK = 5
+
+def emit(event, **fields):
+    print(json.dumps({"event": event, **fields}, default=str), flush=True)
+
+def emit_problems(problems):
+    for problem in problems.to_dict("records"):
+        emit("skipped_row", **problem)
+
+# PRINT EVERY MESSAGE OF A BATCH AS IT FINISHES, THEN THE BATCH TOTALS
+def follow(outbox, batch_id, timeout=None):
+    start = time.monotonic()
+    reported = set()
+    since = 0
+    while True:
+        polled = time.time()
+        # read before the messages, so a finished batch has all of them in this poll
+        progress = outbox.progress(batch_id)
+        for row in outbox.finished(batch_id, since):
+            if row["id"] not in reported:
+                reported.add(row["id"])
+                emit("message", phone=row["phone"], status=row["status"], error=row["error"], provider_id=row["provider_id"])
+        since = polled - LOOKBACK
+        timed_out = timeout is not None and time.monotonic() - start > timeout
+        if progress["done"] or timed_out:
+            emit("done" if progress["done"] else "timeout", batch_id=batch_id, **progress)
+            return progress
+        time.sleep(FOLLOW_INTERVAL)
+
+def send(args):
+    # imported here so --help and argument errors return without loading pandas
+    import messaging
+
+    send_at = datetime.fromisoformat(args.send_at).timestamp() if getattr(args, "send_at", None) else None
+    if args.command == "ia":
+        _, _, problems = messaging.plan_ia_marks(args.students, args.marks, args.ia, args.semester)
+        emit_problems(problems)
+        batch_id = messaging.send_ia_marks(args.students, args.marks, args.ia, args.resend, send_at, args.semester)
+    elif args.command == "circular":
+        emit_problems(messaging.plan_circular(args.students, args.semester).problems)
+        image = messaging.image_file(args.image)
+        batch_id = messaging.send_whatsapp_image(args.students, image, args.semester, args.resend, send_at)
+    else:
+        batch_id = messaging.message_student(args.students, args.message, args.semester, args.usn, args.name)
+
+    outbox = messaging.get_outbox()
+    emit("queued", batch_id=batch_id, label=outbox.batch(batch_id)["label"], send_at=send_at)
+    if args.no_wait:
+        # sent by the app when it is running, otherwise by the next run of this command that waits
+        return 0
+    # sends only if no other process (the app) holds the outbox lease; when one
+    # does, this just follows the batch while that process sends it
+    messaging.get_worker()
+    try:
+        progress = follow(outbox, batch_id, args.timeout)
+    finally:
+        messaging.stop_worker()
+    return 0 if progress["done"] and not progress["failed"] else 1
+
+def parser():
+    parser = argparse.ArgumentParser(description="Queue and send messages to parents without the web app")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ia = commands.add_parser("ia", help="send I.A. marks")
+    ia.add_argument("--students", required=True, help="students workbook")
+    ia.add_argument("--marks", required=True, help="marks workbook with 'IA N' sheets")
+    ia.add_argument("--ia", type=int, required=True, choices=[1, 2, 3])
+    ia.add_argument("--semester", type=int, help="read students from the 'sem N' sheet instead of the first sheet")
+
+    circular = commands.add_parser("circular", help="send an image circular")
+    circular.add_argument("--students", required=True, help="students workbook")
+    circular.add_argument("--image", required=True, help="jpg or png file")
+    circular.add_argument("--semester", type=int, nargs="*", help="'sem N' sheets to send to, the first sheet when not given")
+
+    message = commands.add_parser("message", help="message one parent")
+    message.add_argument("--students", required=True, help="students workbook")
+    message.add_argument("--semester", type=int, required=True)
+    student = message.add_mutually_exclusive_group(required=True)
+    student.add_argument("--usn")
+    student.add_argument("--name")
+    message.add_argument("--message", required=True)
+
+    for command in (ia, circular, message):
+        command.add_argument("--no-wait", action="store_true", help="only queue the batch")
+        command.add_argument("--timeout", type=float, help="stop following the batch after this many seconds")
+    # a single message is always sent, even when the parent already got the same text
+    for command in (ia, circular):
+        command.add_argument("--resend", action="store_true", help="send again to parents who already received it")
+        command.add_argument("--send-at", help="local start time, e.g. 2024-05-01T09:00")
+    return parser
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    try:
+        return send(args)
+    except Exception as e:
+        emit("error", error=str(e))
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
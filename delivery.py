@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# DELIVERY RECEIPTS FOR SENT MESSAGES, MATCHED TO OUTBOX ROWS BY PROVIDER MESSAGE ID
+# receipts come from the provider's webhook when this process is reachable,
+# otherwise the poller asks for the status of a whole page of messages at once
+
+# port of the local webhook endpoint, unset: poll instead
+WEBHOOK_PORT = int(os.environ.get("DELIVERY_WEBHOOK_PORT", 0))
+WEBHOOK_HOST = os.environ.get("DELIVERY_WEBHOOK_HOST", "0.0.0.0")
+# expected as ?token=... on the webhook URL registered with the provider
+WEBHOOK_TOKEN = os.environ.get("DELIVERY_WEBHOOK_TOKEN")
+# seconds between polling rounds, 0 disables polling
+POLL_INTERVAL = float(os.environ.get("DELIVERY_POLL_INTERVAL", 60))
+# message ids per status request
+POLL_PAGE_SIZE = int(os.environ.get("DELIVERY_POLL_PAGE_SIZE", 100))
+# messages older than this are no longer polled
+TRACK_WINDOW = float(os.environ.get("DELIVERY_TRACK_HOURS", 24)) * 3600
+
+# PROVIDER STATUS / ACK NAMES -> OUTBOX DELIVERY STATES
+STATES = {
+    "sent": "sent",
+    "server": "sent",
+    "delivered": "delivered",
+    "device": "delivered",
+    "read": "read",
+    "played": "read",
+    "failed": "failed",
+    "error": "failed",
+}
+
+def delivery_state(status):
+    return STATES.get(str(status or "").lower())
+
+# (message id, state) PAIRS FROM A WEBHOOK BODY: ONE EVENT OR A LIST OF EVENTS,
+# EACH WITH THE MESSAGE UNDER "data" ({"event": "message:out:ack", "data": {"id", "ack"}})
+def receipts(body):
+    events = body if isinstance(body, list) else [body]
+    found = []
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        data = event.get("data") if isinstance(event.get("data"), dict) else event
+        state = delivery_state(data.get("ack") or data.get("deliveryStatus") or data.get("status"))
+        if data.get("id") and state:
+            found.append((data["id"], state))
+    return found
+
+# SMALL HTTP SERVER THE PROVIDER POSTS RECEIPTS TO
+class DeliveryWebhook:
+    def __init__(self, outbox, host=WEBHOOK_HOST, port=WEBHOOK_PORT, token=WEBHOOK_TOKEN):
+        self.outbox = outbox
+        self.token = token
+        self.received = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="delivery-webhook", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def reply(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if webhook.token and parse_qs(urlparse(self.path).query).get("token") != [webhook.token]:
+                    return self.reply(403)
+                try:
+                    found = receipts(json.loads(body or b"null"))
+                except ValueError:
+                    return self.reply(400)
+                webhook.outbox.set_delivery(found)
+                webhook.received += len(found)
+                # answered quickly, the provider retries slow or failed webhooks
+                self.reply(204)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+# BACKGROUND THREAD ASKING THE PROVIDER FOR RECEIPTS OF RECENT MESSAGES
+# fetch(ids) returns {message id: provider status} for one page of ids
+# with several devices, one poller per shard fetches through that device
+class DeliveryPoller(threading.Thread):
+    def __init__(self, outbox, fetch, interval=POLL_INTERVAL, page_size=POLL_PAGE_SIZE, window=TRACK_WINDOW, shard=None):
+        super().__init__(name="delivery-poller" + (f"-{shard}" if shard else ""), daemon=True)
+        self.shard = shard
+        self.outbox = outbox
+        self.fetch = fetch
+        self.interval = interval
+        self.page_size = page_size
+        self.window = window
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Delivery polling failed. Error: {e}")
+
+    # ONE ROUND OVER EVERY MESSAGE STILL WAITING FOR A RECEIPT
+    def poll(self):
+        since = time.time() - self.window
+        after = 0
+        while not self.stopping.is_set():
+            page = self.outbox.awaiting_delivery(since, after, self.page_size, self.shard)
+            if not page:
+                return
+            after = page[-1][0]
+            statuses = self.fetch([message_id for _, message_id in page])
+            self.outbox.set_delivery(
+                (message_id, delivery_state(status)) for message_id, status in statuses.items()
+            )
+
+    def stop(self):
+        self.stopping.set()
@@ -0,0 +1,78 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from profiling import profile_threads
+
+# MAXIMUM NUMBER OF PROVIDER REQUESTS IN FLIGHT AT ONCE
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", 8))
+
+# RUN ONE JOB, NEVER RAISE: FAILURES ARE RECORDED IN THE RESULT
+def _run(send, job):
+    start = time.perf_counter()
+    try:
+        response = send(*job)
+        error = None if response is not None else "no response"
+    except Exception as e:
+        response, error = None, str(e)
+    return {
+        "phone": job[0],
+        "response": response,
+        "error": error,
+        "elapsed": time.perf_counter() - start,
+    }
+
+# FAN OUT ALL JOBS OF A BATCH, AT MOST max_in_flight AT A TIME
+# each job is the argument tuple for send(), phone number first
+# results come back in the same order as jobs; on_result(i, result) is
+# called from the calling thread as soon as jobs[i] finishes
+def dispatch(send, jobs, max_in_flight=MAX_IN_FLIGHT, on_result=None):
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+    workers = max(1, min(max_in_flight, len(jobs)))
+    # the sends run on the pool threads, a profile of the caller alone would miss them
+    run = profile_threads(_run)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch") as pool:
+        futures = {pool.submit(run, send, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            if on_result:
+                on_result(futures[future], result)
+    return results
+
+def failed(results):
+    return [r for r in results if r["error"]]
+
+# THROUGHPUT CHECK AGAINST A LOCAL MOCK ENDPOINT
+# python dispatch.py [messages] [latency_ms]  (see bench.py for the full suite)
+if __name__ == "__main__":
+    import sys
+    import requests
+    from mock_provider import MockProvider
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    mock = MockProvider(latency).start()
+    url = mock.url + "/v1/messages"
+
+    def post(phone, message):
+        response = requests.post(url, json={"phone": phone, "message": message}, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    jobs = [(f"+91900000{i:04d}", "test") for i in range(count)]
+
+    start = time.perf_counter()
+    for job in jobs:
+        post(*job)
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = dispatch(post, jobs)
+    concurrent = time.perf_counter() - start
+    mock.stop()
+
+    print(f"serial:     {count / serial:8.1f} msg/s ({serial:.2f}s)")
+    print(f"concurrent: {count / concurrent:8.1f} msg/s ({concurrent:.2f}s, max_in_flight={MAX_IN_FLIGHT}, failed={len(failed(results))})")
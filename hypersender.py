@@ -1,23 +1,9 @@
-import requests
-import json
 import os
+from provider import get_client
 
-API_ID = os.environ['HYPERSENDER_ID']
-API_TOKEN = os.environ['HYPERSENDER_API']
 PHONE_NUMBER = os.environ['PHONE_NUMBER']
-url = "https://app.hypersender.com/api/whatsapp/v1/"+API_ID+"/send-text-safe"
 
-payload = json.dumps({
-  "chatId": PHONE_NUMBER + "@c.us",
-  "text": "okay",
-  "link_preview": True
-})
-headers = {
-  'Content-Type': 'application/json',
-  'Accept': 'application/json',
-  'Authorization': 'Bearer ' + API_TOKEN
-}
+# uses the shared pooled client (HYPERSENDER_ID / HYPERSENDER_API from the environment)
+response = get_client().send_text_safe(PHONE_NUMBER, "okay")
 
-response = requests.request("POST", url, headers=headers, data=payload)
-
-print(response.text)
\ No newline at end of file
+print(response.text)
@@ -0,0 +1,103 @@
+import os
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# LOCAL SQLITE FILE RECORDING WHICH (BATCH, RECIPIENT, CONTENT) WAS DELIVERED
+
+LEDGER_PATH = os.environ.get("LEDGER_PATH", os.environ.get("OUTBOX_PATH", "outbox.sqlite3"))
+# entries older than this are forgotten
+LEDGER_TTL = float(os.environ.get("LEDGER_TTL_DAYS", 30)) * 86400
+# hard cap on stored entries, oldest go first
+LEDGER_MAX_ROWS = int(os.environ.get("LEDGER_MAX_ROWS", 200000))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    batch_key TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL,
+    owner TEXT,
+    PRIMARY KEY (batch_key, phone, content_hash)
+);
+CREATE INDEX IF NOT EXISTS ledger_updated ON ledger(updated);
+"""
+
+# ONE WRITE TRANSACTION ON A CONNECTION OPENED WITH isolation_level=None
+# (autocommit: `with db` alone groups nothing); IMMEDIATE takes the write lock
+# up front, so reads and writes inside cannot interleave with another process
+@contextmanager
+def transaction(db, lock):
+    with lock:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+def content_hash(message, file_id=None):
+    return hashlib.sha256(f"{message}\0{file_id or ''}".encode()).hexdigest()
+
+# SAME KIND AND SAME RECIPIENTS/CONTENT GIVE THE SAME KEY, SO RE-SUBMITTING
+# A BATCH RESUMES IT; resend=True STARTS A FRESH BATCH ON PURPOSE
+def batch_key(kind, jobs, resend=False):
+    digest = hashlib.sha256(kind.encode())
+    for job in sorted(jobs, key=lambda job: (job[0], job[1])):
+        digest.update(f"{job[0]}\0{content_hash(*job[1:])}\n".encode())
+    if resend:
+        digest.update(uuid.uuid4().bytes)
+    return digest.hexdigest()
+
+class Ledger:
+    def __init__(self, path=LEDGER_PATH):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    # CLAIM THE RIGHT TO SEND; FALSE IF ALREADY DELIVERED OR BEING SENT
+    # owner is the sending process (Outbox.owner)
+    def reserve(self, key, phone, digest, owner=None):
+        with transaction(self.db, self.lock):
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO ledger (batch_key, phone, content_hash, state, updated, owner) VALUES (?, ?, ?, 'reserved', ?, ?)",
+                (key, phone, digest, time.time(), owner),
+            )
+            return cursor.rowcount == 1
+
+    def delivered(self, entries):
+        now = time.time()
+        with transaction(self.db, self.lock):
+            self.db.executemany(
+                "UPDATE ledger SET state = 'delivered', updated = ? WHERE batch_key = ? AND phone = ? AND content_hash = ?",
+                [(now, *entry) for entry in entries],
+            )
+
+    # FAILED SENDS GIVE UP THEIR RESERVATION SO THEY CAN BE RETRIED
+    def release(self, entries):
+        with transaction(self.db, self.lock):
+            self.db.executemany(
+                "DELETE FROM ledger WHERE batch_key = ? AND phone = ? AND content_hash = ? AND state = 'reserved'",
+                entries,
+            )
+
+    # RESERVATIONS LEFT BY A KILLED PROCESS (ANY OWNER BUT keep); THE REQUEST MAY
+    # OR MAY NOT HAVE REACHED THE PROVIDER, SO THIS IS THE ONLY CASE WHERE A
+    # PARENT CAN GET A MESSAGE TWICE
+    def clear_reserved(self, keep=None):
+        with transaction(self.db, self.lock):
+            self.db.execute("DELETE FROM ledger WHERE state = 'reserved' AND owner IS NOT ?", (keep,))
+
+    def prune(self):
+        with transaction(self.db, self.lock):
+            self.db.execute("DELETE FROM ledger WHERE updated < ?", (time.time() - LEDGER_TTL,))
+            self.db.execute(
+                "DELETE FROM ledger WHERE rowid IN (SELECT rowid FROM ledger ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                (LEDGER_MAX_ROWS,),
+            )
@@ -0,0 +1,139 @@
+import os
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from ledger import transaction
+
+# UPLOADED MEDIA: FILE IDS ARE REMEMBERED BY IMAGE CONTENT, SO THE SAME
+# CIRCULAR IS ONLY UPLOADED ONCE PER ACCOUNT WHILE THE PROVIDER KEEPS IT
+
+MEDIA_PATH = os.environ.get("MEDIA_PATH", os.environ.get("OUTBOX_PATH", "outbox.sqlite3"))
+# cached file ids expire before the provider deletes the uploaded file
+MEDIA_TTL = float(os.environ.get("MEDIA_TTL_DAYS", 7)) * 86400
+# images larger than this are downscaled / recompressed before upload (needs Pillow), 0 disables
+TARGET_BYTES = int(os.environ.get("MEDIA_TARGET_KB", 1024)) * 1024
+# longest side of a recompressed image, in pixels
+MAX_DIMENSION = int(os.environ.get("MEDIA_MAX_DIMENSION", 2048))
+# JPEG qualities tried in order until the image fits TARGET_BYTES
+QUALITIES = (85, 75, 65, 55)
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    media_key TEXT PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    uploaded REAL NOT NULL
+);
+"""
+
+def _size(source):
+    if hasattr(source, "size"):
+        return source.size
+    position = source.tell()
+    size = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return size
+
+# CONTENT HASH OF A FILE OBJECT, READ IN CHUNKS
+def _digest(source):
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+# SMALLER JPEG OF A LARGE IMAGE, RETURNS (name, file object, mime type)
+# the original is returned when it is small enough, Pillow is not installed,
+# or recompressing does not make it smaller
+def prepare_image(source, name, mime_type, target_bytes=TARGET_BYTES, max_dimension=MAX_DIMENSION):
+    size = _size(source)
+    if not target_bytes or size <= target_bytes:
+        return name, source, mime_type
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return name, source, mime_type
+
+    source.seek(0)
+    try:
+        image = Image.open(source)
+    except OSError:
+        # not an image Pillow can read, uploaded as it is
+        source.seek(0)
+        return name, source, mime_type
+    with image:
+        # JPEGs are decoded at a reduced scale when that is still large enough
+        image.draft("RGB", (max_dimension, max_dimension))
+        # phone cameras store the orientation in EXIF, which re-encoding drops
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode != "RGB":
+            # transparent areas become white instead of black
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        # spills to disk above CHUNK_SIZE instead of holding another copy in memory
+        output = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+        for quality in QUALITIES:
+            output.seek(0)
+            output.truncate()
+            image.save(output, "JPEG", quality=quality, optimize=True)
+            if output.tell() <= target_bytes:
+                break
+    source.seek(0)
+    if output.tell() >= size:
+        output.close()
+        return name, source, mime_type
+    output.seek(0)
+    return os.path.splitext(name)[0] + ".jpg", output, "image/jpeg"
+
+class MediaCache:
+    def __init__(self, path=MEDIA_PATH, ttl=MEDIA_TTL, target_bytes=TARGET_BYTES, max_dimension=MAX_DIMENSION):
+        self.ttl = ttl
+        self.target_bytes = target_bytes
+        self.max_dimension = max_dimension
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    # SAME IMAGE, ACCOUNT AND COMPRESSION SETTINGS GIVE THE SAME KEY
+    def key(self, source, account=""):
+        return hashlib.sha256(f"{_digest(source)}\0{account}\0{self.target_bytes}\0{self.max_dimension}".encode()).hexdigest()
+
+    def file_id(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT file_id FROM media WHERE media_key = ? AND uploaded >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, key, file_id):
+        now = time.time()
+        with transaction(self.db, self.lock):
+            self.db.execute("DELETE FROM media WHERE uploaded < ?", (now - self.ttl,))
+            self.db.execute(
+                "INSERT OR REPLACE INTO media (media_key, file_id, uploaded) VALUES (?, ?, ?)",
+                (key, file_id, now),
+            )
+
+    # FILE ID OF AN UPLOADED IMAGE (name / type attributes like st.file_uploader's),
+    # UPLOADING IT THROUGH upload(name, file, mime_type) ONLY ON A CACHE MISS
+    def upload(self, source, upload, account=""):
+        key = self.key(source, account)
+        file_id = self.file_id(key)
+        if file_id:
+            return file_id
+        name, data, mime_type = prepare_image(source, source.name, source.type, self.target_bytes, self.max_dimension)
+        try:
+            file_id = upload(name, data, mime_type)
+        finally:
+            if data is not source:
+                data.close()
+        self.store(key, file_id)
+        return file_id
@@ -0,0 +1,215 @@
+import io
+import os
+import mimetypes
+from functools import cache
+import pandas as pd
+from shards import SenderPool, sender_keys
+from outbox import Outbox
+from ledger import batch_key
+from render import ia_jobs
+from broadcast import BroadcastPlan
+from phones import normalize_phone, preflight
+from templates import LANGUAGE_COLUMN, get_templates
+from media import MediaCache
+from delivery import WEBHOOK_PORT, POLL_INTERVAL, DeliveryWebhook, DeliveryPoller
+import metrics
+from profiling import profile_calls
+from scheduler import PRIORITY_MESSAGE
+from roster import RosterCache
+from catalog import FileCatalog
+
+# SEND LOGIC SHARED BY THE STREAMLIT APP (v4.py) AND THE COMMAND LINE (cli.py)
+# nothing here imports streamlit; problems are raised as exceptions for the
+# caller to show, and each resource below is created once per process
+
+# PROVIDER CLIENTS, ONE PER DEVICE, CREATED ONCE PER PROCESS
+# WASSENGER_API holds one key per sending device, comma separated; it is read
+# on first use so importing this module needs no configuration
+@cache
+def get_senders():
+    return SenderPool(sender_keys(os.environ.get("WASSENGER_API")))
+
+# CLIENT OF ONE SHARD (DEVICE), THE FIRST DEVICE WHEN NOT GIVEN
+def get_client(shard=None):
+    senders = get_senders()
+    return senders.client(shard) if shard else next(iter(senders.clients.values()))
+
+# OUTBOX OF QUEUED MESSAGES AND THE WORKERS THAT DRAIN IT (ONE PER DEVICE), ONE PER PROCESS
+@cache
+def get_outbox():
+    return Outbox(route=get_senders().route)
+
+# the workers send only while this process holds the outbox lease: a cli.py run
+# next to the app queues its batch and the app sends it
+@cache
+def get_worker():
+    return get_senders().start_workers(get_outbox(), send_outbox_message)
+
+# FINISH THE CLAIMS IN FLIGHT AND GIVE UP THE LEASE, SO ANOTHER PROCESS TAKES
+# OVER WITHOUT WAITING FOR IT TO GO STALE
+def stop_worker():
+    workers = get_worker()
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join()
+    lease = workers[0].lease
+    lease.stop()
+    lease.join()
+
+# DELIVERY RECEIPTS: A LOCAL WEBHOOK WHEN DELIVERY_WEBHOOK_PORT IS SET, POLLING OTHERWISE
+@cache
+def get_delivery_tracker():
+    if WEBHOOK_PORT:
+        return DeliveryWebhook(get_outbox()).start()
+    if POLL_INTERVAL:
+        # message ids are only known to the device that sent them
+        pollers = []
+        for shard, client in get_senders().clients.items():
+            poller = DeliveryPoller(get_outbox(), client.message_statuses, shard=shard)
+            poller.start()
+            pollers.append(poller)
+        return pollers
+    return None
+
+# PROMETHEUS /metrics ENDPOINT WHEN METRICS_PORT IS SET
+@cache
+def get_metrics_server():
+    if metrics.METRICS_PORT:
+        return metrics.serve()
+    return None
+
+# PARSED WORKBOOK SHEETS, SHARED BY ALL SESSIONS
+@cache
+def get_roster_cache():
+    return RosterCache()
+
+def read_sheet(workbook, sheet_name=0):
+    return get_roster_cache().read_sheet(workbook, sheet_name)
+
+def read_index(workbook, sheet_name=0):
+    return get_roster_cache().read_index(workbook, sheet_name)
+
+def read_workbook(workbook):
+    return get_roster_cache().read_workbook(workbook)
+
+# WASSENGER FILE IDS OF ALREADY UPLOADED IMAGES
+@cache
+def get_media_cache():
+    return MediaCache()
+
+# WORKBOOKS AVAILABLE FOR AUTO LOAD, KEPT UP TO DATE INCREMENTALLY
+@cache
+def get_file_catalog():
+    return FileCatalog()
+
+# MAIN API CALL 
+# not cached: runs on outbox worker threads, the ledger prevents duplicate sends
+# and errors propagate so the outbox records why a message failed
+# client is the recipient's device, the first device when not given
+def send_whatsapp_message(phone, message, client=None):
+    return (client or get_client()).send_message(phone, message)
+    
+# UPLOAD IMAGE TO WASSENGER, RETURN FILE ID
+# the same image is uploaded once per device, large photos are recompressed first
+def upload_image_to_wassenger(image_file, client=None):
+    client = client or get_client()
+    return get_media_cache().upload(image_file, client.upload_file, client.wassenger_account)
+
+# API CALL TO SEND MESSAGE WITH IMAGE
+def send_whatsapp_image_message(phone, message, file_id, client=None):
+    return (client or get_client()).send_message(phone, message, file_id)
+
+# SEND ONE OUTBOX MESSAGE, WITH OR WITHOUT AN IMAGE
+def send_outbox_message(phone, message, file_id=None, client=None):
+    if file_id:
+        return send_whatsapp_image_message(phone, message, file_id, client)
+    return send_whatsapp_message(phone, message, client)
+
+# MERGED IA MARKS ROWS THAT CAN BE SENT, THEIR SUBJECTS AND A REPORT OF THE ROWS LEFT OUT
+# a student listed twice is messaged once, siblings sharing a number each get their marks
+# students come from the 'sem N' sheet when semester is given, the first sheet otherwise
+def plan_ia_marks(students_info, marks, ia, semester=None):
+    df_students_info = read_sheet(students_info, sheet_name='sem ' + str(semester) if semester else 0)
+    df_marks = read_sheet(marks, sheet_name = 'IA ' + str(ia))
+
+    # checked on the students sheet, so the report has its Excel rows
+    df_students_info, problems = preflight(df_students_info, dedupe=["USN"])
+    with metrics.MERGE.time():
+        data = pd.merge(df_students_info, df_marks, on="USN")
+    subjects = [column for column in data.columns[3:] if column != LANGUAGE_COLUMN] # this is assuming the user has followed the excel format instructions
+    return data, subjects, problems
+
+# FUNCTION TO SEND IA MARKS TO PARENTS
+# resend=True sends again to parents who already got this exact batch
+@profile_calls("send_ia_marks")
+def send_ia_marks(students_info, marks, ia, resend=False, send_at=None, semester=None):
+    data, subjects, _ = plan_ia_marks(students_info, marks, ia, semester)
+    # one (phone, message) pair per row with a valid number
+    jobs = ia_jobs(data, subjects, f"I.A. {ia}")
+    if not jobs:
+        raise ValueError("No student with a valid parent phone number has marks in this sheet.")
+    return get_outbox().enqueue("ia", jobs, label=f"I.A. {ia} marks", key=batch_key("ia", jobs, resend), send_at=send_at)
+
+# RECIPIENTS OF A CIRCULAR: THE SELECTED SEMESTER SHEETS, ONE ENTRY PER PARENT PHONE
+# without semesters the first sheet of the file is used
+def plan_circular(students_info, semesters=None):
+    if not semesters:
+        return BroadcastPlan({None: read_sheet(students_info)})
+    workbook = read_workbook(students_info)
+    return BroadcastPlan({semester_no: workbook.semester(semester_no) for semester_no in semesters})
+
+# FUNCTION TO SEND CIRCULAR TO PARENTS
+# every selected semester goes out as one batch, the image is uploaded once
+@profile_calls("send_whatsapp_image")
+def send_whatsapp_image(students_info, image, semesters=None, resend=False, send_at=None):
+    plan = plan_circular(students_info, semesters)
+    if not len(plan):
+        raise ValueError("No parent phone numbers in the selected sheets.")
+    # uploaded files belong to one device, so each device sending part of
+    # the circular gets its own copy
+    senders = get_senders()
+    file_ids = {}
+    for shard in senders.split(plan.phones):
+        file_ids[shard] = upload_image_to_wassenger(image, get_client(shard))
+
+    semesters_text = ", ".join(str(semester_no) for semester_no in semesters or [])
+    # caption from the 'circular' templates, in each parent's language
+    captions = get_templates().render("circular", plan.recipients, semesters=semesters_text)
+    jobs = [(phone, caption, file_ids[senders.route(phone)]) for phone, caption in zip(plan.phones, captions)]
+    label = "Circular" if not semesters else "Circular for Semester " + semesters_text
+    return get_outbox().enqueue("circular", jobs, label=label, key=batch_key("circular", jobs, resend), send_at=send_at)
+
+# FUNCTION TO SEND MESSAGE TO SINGLE PARENT
+# every call is a new message, even with the same text as an earlier one
+@profile_calls("message_student")
+def message_student(students_info, message, semester_no, student_usn = None, student_name = None):
+    index = read_index(students_info, sheet_name='sem ' + str(semester_no))
+    if (student_usn):
+        record = index.by_usn(student_usn)
+        if record is None:
+            raise ValueError(f"No student with USN {student_usn} in Semester {semester_no}.")
+    elif (student_name):
+        records = index.by_name(student_name)
+        if len(records) != 1:
+            raise ValueError(f"Found {len(records)} students named {student_name}, please find the student by USN.")
+        record = records[0]
+    else:
+        raise ValueError("Select a student by USN or name.")
+    p_no = normalize_phone(record['Phone Number'])
+    if pd.isna(p_no):
+        raise ValueError(f"{record['Phone Number']} is not a valid phone number.")
+    # the typed message goes into the 'message' template as {message}, it is never parsed itself
+    body = get_templates().render("message", pd.DataFrame([record]), message=message).iloc[0]
+    jobs = [(p_no, body)]
+    # single messages skip the bulk queue and its sending hours; a fresh key, so
+    # the ledger never skips them as already sent
+    return get_outbox().enqueue("message", jobs, label="Message to " + p_no, key=batch_key("message", jobs, resend=True), priority=PRIORITY_MESSAGE)
+
+# AN IMAGE ON DISK AS AN UPLOADED FILE (name / type attributes like st.file_uploader's)
+def image_file(path):
+    with open(path, "rb") as f:
+        image = io.BytesIO(f.read())
+    image.name = os.path.basename(path)
+    image.type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return image
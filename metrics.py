@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# IN-PROCESS COUNTERS AND LATENCY HISTOGRAMS, RENDERED IN THE PROMETHEUS TEXT FORMAT
+# on /metrics when METRICS_PORT is set, and on the Metrics page of the app
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# messages per batch
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_metrics = []
+_lock = threading.Lock()
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+    def rows(self):
+        return [
+            {"metric": self.name, "labels": _labels(self.labels, key), "count": value, "mean": None, "p95": None}
+            for key, value in sorted(self.values.items())
+        ]
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with _lock:
+            counts, _ = entry = self.values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+
+    # TIME THE BLOCK AND OBSERVE ITS DURATION, ALSO WHEN IT RAISES
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    # UPPER BOUND OF THE BUCKET HOLDING THE q-th QUANTILE
+    def _quantile(self, counts, q):
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+    def rows(self):
+        return [
+            {
+                "metric": self.name,
+                "labels": _labels(self.labels, key),
+                "count": sum(counts),
+                "mean": total / max(sum(counts), 1),
+                "p95": self._quantile(counts, 0.95),
+            }
+            for key, (counts, total) in sorted(self.values.items())
+        ]
+
+def counter(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+# METRICS RECORDED BY THE APP
+
+PROVIDER_LATENCY = histogram("provider_request_seconds", "Wassenger / Hypersender request latency.", ["endpoint"])
+PROVIDER_RESPONSES = counter("provider_responses_total", "Wassenger / Hypersender responses by HTTP status ('error' when no response).", ["endpoint", "status"])
+TWILIO_LATENCY = histogram("twilio_request_seconds", "Twilio messages.create latency.")
+TWILIO_RESPONSES = counter("twilio_responses_total", "Twilio messages.create outcomes by HTTP status.", ["status"])
+EXCEL_PARSE = histogram("excel_parse_seconds", "pd.read_excel time for a whole workbook.")
+MERGE = histogram("merge_seconds", "pd.merge time of students and marks.")
+BATCH_SIZE = histogram("batch_size", "Messages per queued batch.", ["kind"], SIZE_BUCKETS)
+MESSAGES = counter("outbox_messages_total", "Outbox messages by final status.", ["status"])
+
+def render():
+    with _lock:
+        lines = [line for metric in _metrics for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+# ONE ROW PER METRIC AND LABEL SET, FOR A TABLE IN THE APP
+def rows():
+    with _lock:
+        return [row for metric in _metrics for row in metric.rows()]
+
+# PROMETHEUS SCRAPE ENDPOINT
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def serve(host=METRICS_HOST, port=METRICS_PORT):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
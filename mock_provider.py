@@ -0,0 +1,114 @@
+import json
+import time
+import uuid
+import random
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# LOCAL STAND-IN FOR THE WASSENGER AND HYPERSENDER APIS
+#   POST /v1/messages                                 -> 201 {"id", "status"}
+#   POST /v1/files                                    -> 201 [{"id"}]
+#   POST /api/whatsapp/v1/<instance>/send-text-safe   -> 200 {"id", "status"}
+#   GET  /v1/messages?ids=a,b                         -> 200 [{"id", "status", "deliveryStatus"}]
+# point the app at it with WASSENGER_URL=http://127.0.0.1:<port>/v1 and
+# HYPERSENDER_URL=http://127.0.0.1:<port>/api/whatsapp/v1
+
+class MockProvider:
+    def __init__(self, latency=0.02, error_rate=0.0, throttle_rate=0.0, retry_after=1, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.counts = {"messages": 0, "files": 0, "hypersender": 0, "statuses": 0, "errors": 0, "throttled": 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="mock-provider", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # write status, headers and body in one segment (avoids delayed-ACK stalls)
+            wbufsize = 64 * 1024
+
+            def reply(self, status, body=None, headers=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(provider.latency)
+                roll = random.random()
+                if roll < provider.throttle_rate:
+                    provider._count("throttled")
+                    return self.reply(429, {"message": "Too many requests"}, {"Retry-After": str(provider.retry_after)})
+                if roll < provider.throttle_rate + provider.error_rate:
+                    provider._count("errors")
+                    return self.reply(500, {"message": "Injected error"})
+                if self.path.endswith("/v1/messages"):
+                    provider._count("messages")
+                    return self.reply(201, {"id": uuid.uuid4().hex, "status": "queued"})
+                if self.path.endswith("/v1/files"):
+                    provider._count("files")
+                    return self.reply(201, [{"id": uuid.uuid4().hex}])
+                if self.path.endswith("/send-text-safe"):
+                    provider._count("hypersender")
+                    return self.reply(200, {"id": uuid.uuid4().hex, "status": "queued"})
+                self.reply(404, {"message": "Not found"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if not url.path.endswith("/v1/messages"):
+                    return self.reply(404, {"message": "Not found"})
+                provider._count("statuses")
+                ids = [i for i in parse_qs(url.query).get("ids", [""])[0].split(",") if i]
+                self.reply(200, [{"id": i, "status": "delivered", "deliveryStatus": "delivered"} for i in ids])
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+# python mock_provider.py [--port 8080] [--latency-ms 20] [--error-rate 0] [--throttle-rate 0]
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local mock of the Wassenger / Hypersender APIs")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1)
+    args = parser.parse_args()
+
+    mock = MockProvider(args.latency_ms / 1000, args.error_rate, args.throttle_rate, args.retry_after, port=args.port)
+    print(f"Mock provider on {mock.url} (WASSENGER_URL={mock.url}/v1)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
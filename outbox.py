@@ -0,0 +1,470 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from dispatch import MAX_IN_FLIGHT, dispatch
+from ledger import Ledger, batch_key, content_hash, transaction
+from progress import RATE_WINDOW, eta, send_rate
+from metrics import BATCH_SIZE, MESSAGES
+from profiling import profiled
+from scheduler import PRIORITY_BULK, PRIORITY_MESSAGE, BulkPacer
+
+# LOCAL SQLITE FILE HOLDING EVERY QUEUED MESSAGE
+
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "outbox.sqlite3")
+# how long an idle worker sleeps before checking for new messages
+POLL_INTERVAL = 1.0
+# how often the worker drops expired ledger entries (seconds)
+PRUNE_INTERVAL = 3600
+# how often finished messages are written back while a claim is being sent (seconds)
+PROGRESS_INTERVAL = 0.5
+# the process sending from the outbox renews its lease this often (seconds)
+HEARTBEAT_INTERVAL = 5
+# a lease not renewed for this long (seconds) belongs to a process that is gone
+LEASE_TIMEOUT = float(os.environ.get("OUTBOX_LEASE_SECONDS", 30))
+# single messages sent at once by each worker's priority lane
+PRIORITY_IN_FLIGHT = int(os.environ.get("PRIORITY_IN_FLIGHT", 2))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    batch_key TEXT,
+    label TEXT,
+    total INTEGER NOT NULL,
+    created REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    send_at REAL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL REFERENCES batches(id),
+    phone TEXT NOT NULL,
+    message TEXT NOT NULL,
+    file_id TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    error TEXT,
+    response TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    elapsed REAL,
+    updated REAL NOT NULL,
+    provider_id TEXT,
+    delivery TEXT,
+    delivery_updated REAL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    shard TEXT,
+    owner TEXT
+);
+CREATE TABLE IF NOT EXISTS lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_status ON messages(status, id);
+CREATE INDEX IF NOT EXISTS messages_batch ON messages(batch_id, status);
+CREATE INDEX IF NOT EXISTS messages_provider_id ON messages(provider_id);
+CREATE INDEX IF NOT EXISTS messages_shard_claim ON messages(status, shard, priority DESC, seq, id);
+"""
+
+# DELIVERY STATES REPORTED BY THE PROVIDER, IN THE ORDER THEY HAPPEN;
+# A LATE OR REPEATED RECEIPT NEVER MOVES A MESSAGE BACK
+DELIVERY_STATES = ["sent", "delivered", "read", "failed"]
+# polling stops at these; a later 'read' can still arrive through the webhook
+FINAL_DELIVERY_STATES = ("delivered", "read", "failed")
+DELIVERY_RANK = "CASE delivery " + " ".join(f"WHEN '{state}' THEN {rank}" for rank, state in enumerate(DELIVERY_STATES, 1)) + " ELSE 0 END"
+
+# MESSAGE ID FROM A PROVIDER RESPONSE, NONE IF IT HAS NONE
+def provider_id(response):
+    if isinstance(response, dict):
+        return response.get("id")
+    return None
+
+# PERSISTENT QUEUE OF BATCHES; SAFE TO SHARE BETWEEN THREADS
+# route(phone) names the shard (sending device) of each message, see shards.py
+# several processes (the app, cli.py runs) may queue into the same file, but
+# only the one holding the lease sends, see OutboxLease
+class Outbox:
+    def __init__(self, path=OUTBOX_PATH, route=None):
+        self.path = path
+        self.route = route
+        # marks the rows and ledger reservations this process is sending
+        self.owner = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        # one event per worker, set when new messages are queued
+        self.wakeups = []
+
+    def _write(self, sql, rows=None):
+        with transaction(self.db, self.lock):
+            if rows is None:
+                return self.db.execute(sql)
+            return self.db.executemany(sql, rows)
+
+    def _read(self, sql, args=()):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    # ADD A BATCH, jobs ARE (phone, message[, file_id]) TUPLES; RETURNS THE BATCH ID
+    # batches with the same key share one idempotency ledger entry per recipient;
+    # nothing is sent before send_at (a timestamp), higher priority goes first
+    def enqueue(self, kind, jobs, label=None, key=None, priority=PRIORITY_BULK, send_at=None):
+        jobs = [(job[0], job[1], job[2] if len(job) > 2 else None) for job in jobs]
+        batch_id = uuid.uuid4().hex
+        key = key or batch_key(kind, jobs)
+        now = time.time()
+        not_before = send_at or 0
+        # seq interleaves batches of the same priority: every batch's first
+        # message is claimed before any batch's second one
+        rows = [
+            (batch_id, *job, priority, seq, not_before, self.route(job[0]) if self.route else None, now)
+            for seq, job in enumerate(jobs)
+        ]
+        # the batch and its messages are written together or not at all
+        with transaction(self.db, self.lock):
+            self.db.execute(
+                "INSERT INTO batches (id, kind, batch_key, label, total, created, priority, send_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (batch_id, kind, key, label, len(rows), now, priority, send_at),
+            )
+            self.db.executemany(
+                "INSERT INTO messages (batch_id, phone, message, file_id, priority, seq, not_before, shard, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        BATCH_SIZE.observe(len(rows), kind=kind)
+        self.notify()
+        return batch_id
+
+    # TAKE UP TO limit DUE MESSAGES OF ONE SHARD AND MARK THEM AS SENDING:
+    # SINGLE MESSAGES FIRST, THEN AT MOST bulk_limit BULK ONES (ALL OF THEM WHEN NONE)
+    def claim(self, limit, bulk_limit=None, shard=None):
+        now = time.time()
+        query = (
+            "SELECT m.*, b.batch_key FROM messages m JOIN batches b ON b.id = m.batch_id"
+            " WHERE m.status = 'pending' AND m.shard IS ? AND m.priority {} ? AND m.not_before <= ?"
+            " ORDER BY m.priority DESC, m.seq, m.id LIMIT ?"
+        )
+        # select and update in one write transaction, so two processes never claim the same row
+        with transaction(self.db, self.lock):
+            rows = self.db.execute(query.format(">="), (shard, PRIORITY_MESSAGE, now, limit)).fetchall()
+            bulk = limit - len(rows) if bulk_limit is None else min(bulk_limit, limit - len(rows))
+            if bulk > 0:
+                rows += self.db.execute(query.format("<"), (shard, PRIORITY_MESSAGE, now, bulk)).fetchall()
+            self.db.executemany(
+                "UPDATE messages SET status = 'sending', owner = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                [(self.owner, now, row["id"]) for row in rows],
+            )
+        return rows
+
+    # ROUTE PENDING MESSAGES WHOSE SHARD IS NOT ONE OF shards (A REMOVED DEVICE, OR
+    # ONE ONLY THE PROCESS THAT QUEUED THEM HAS) AGAIN; route=None MEANS NO SHARD
+    # only the lease holder calls this, with its own devices; returns how many moved
+    def reshard(self, route, shards):
+        where = " AND ".join("shard IS NOT ?" for _ in shards)
+        rows = self._read(f"SELECT id, phone FROM messages WHERE status = 'pending' AND {where}", tuple(shards))
+        if rows:
+            self._write(
+                "UPDATE messages SET shard = ? WHERE id = ? AND status = 'pending'",
+                [(route(row["phone"]) if route else None, row["id"]) for row in rows],
+            )
+        return len(rows)
+
+    def subscribe(self):
+        event = threading.Event()
+        with self.lock:
+            self.wakeups.append(event)
+        return event
+
+    def notify(self):
+        with self.lock:
+            wakeups = list(self.wakeups)
+        for event in wakeups:
+            event.set()
+
+    # STORE THE OUTCOME OF EACH CLAIMED MESSAGE, results COME FROM dispatch()
+    # rows another process took over in the meantime are left to it
+    def complete(self, rows, results):
+        now = time.time()
+        self._write(
+            "UPDATE messages SET status = ?, error = ?, response = ?, provider_id = ?, elapsed = ?, updated = ?"
+            " WHERE id = ? AND owner = ?",
+            [
+                (
+                    "failed" if result["error"] else "sent",
+                    result["error"],
+                    json.dumps(result["response"]) if result["response"] is not None else None,
+                    provider_id(result["response"]),
+                    result["elapsed"],
+                    now,
+                    row["id"],
+                    self.owner,
+                )
+                for row, result in zip(rows, results)
+            ],
+        )
+        for result in results:
+            MESSAGES.inc(status="failed" if result["error"] else "sent")
+
+    # MESSAGES THE LEDGER SAYS WERE ALREADY DELIVERED
+    def skip(self, rows):
+        now = time.time()
+        self._write(
+            "UPDATE messages SET status = 'skipped', updated = ? WHERE id = ? AND owner = ?",
+            [(now, row["id"], self.owner) for row in rows],
+        )
+        MESSAGES.inc(len(rows), status="skipped")
+
+    # MESSAGES LEFT 'sending' BY A PROCESS THAT LOST THE LEASE (KILLED, OR
+    # STALLED PAST LEASE_TIMEOUT) GO BACK IN THE QUEUE; ONLY CALLED BY THE HOLDER
+    def recover(self):
+        with transaction(self.db, self.lock):
+            self.db.execute(
+                "UPDATE messages SET status = 'pending', owner = NULL WHERE status = 'sending' AND owner IS NOT ?",
+                (self.owner,),
+            )
+
+    # TAKE OR RENEW THE SENDING LEASE; FALSE WHILE ANOTHER LIVE PROCESS HOLDS IT
+    def take_lease(self):
+        now = time.time()
+        with transaction(self.db, self.lock):
+            row = self.db.execute("SELECT owner, heartbeat FROM lease WHERE id = 1").fetchone()
+            if row and row["owner"] != self.owner and row["heartbeat"] > now - LEASE_TIMEOUT:
+                return False
+            self.db.execute(
+                "INSERT OR REPLACE INTO lease (id, owner, heartbeat) VALUES (1, ?, ?)", (self.owner, now)
+            )
+            return True
+
+    # GIVE THE LEASE UP SO ANOTHER PROCESS CAN SEND WITHOUT WAITING FOR LEASE_TIMEOUT
+    def release_lease(self):
+        with transaction(self.db, self.lock):
+            self.db.execute("DELETE FROM lease WHERE id = 1 AND owner = ?", (self.owner,))
+
+    def progress(self, batch_id):
+        counts = {"pending": 0, "sending": 0, "sent": 0, "skipped": 0, "failed": 0}
+        for row in self._read(
+            "SELECT status, COUNT(*) AS n FROM messages WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ):
+            counts[row["status"]] = row["n"]
+        counts["total"] = sum(counts.values())
+        # a batch is written with its messages in one transaction, so an empty one stays empty
+        counts["done"] = counts["pending"] + counts["sending"] == 0
+        # throughput from the completion times of sent / failed messages
+        now = time.time()
+        row = self._read(
+            "SELECT MIN(updated) AS first, MAX(updated) AS last, SUM(updated >= ?) AS recent FROM messages"
+            " WHERE batch_id = ? AND status IN ('sent', 'failed')", (now - RATE_WINDOW, batch_id)
+        )[0]
+        recent = counts["sent"] + counts["failed"] if counts["done"] else row["recent"] or 0
+        counts["rate"] = send_rate(recent, row["first"], row["last"], now, counts["done"])
+        counts["eta"] = eta(counts["pending"] + counts["sending"], counts["rate"])
+        return counts
+
+    def failures(self, batch_id):
+        return [
+            dict(row)
+            for row in self._read(
+                "SELECT phone, error FROM messages WHERE batch_id = ? AND status = 'failed' ORDER BY updated, id", (batch_id,)
+            )
+        ]
+
+    # MESSAGES OF A BATCH THAT FINISHED (sent / skipped / failed) AT OR AFTER since, OLDEST FIRST
+    def finished(self, batch_id, since=0):
+        return [
+            dict(row)
+            for row in self._read(
+                "SELECT id, phone, status, error, provider_id, updated FROM messages"
+                " WHERE batch_id = ? AND status IN ('sent', 'skipped', 'failed') AND updated >= ?"
+                " ORDER BY updated, id", (batch_id, since)
+            )
+        ]
+
+    # SECONDS EACH SENT MESSAGE OF A BATCH SPENT IN THE PROVIDER CALL
+    def latencies(self, batch_id):
+        return [
+            row["elapsed"]
+            for row in self._read(
+                "SELECT elapsed FROM messages WHERE batch_id = ? AND status = 'sent' AND elapsed IS NOT NULL", (batch_id,)
+            )
+        ]
+
+    # DELIVERY RECEIPTS: updates ARE (provider message id, state) PAIRS
+    def set_delivery(self, updates):
+        now = time.time()
+        rows = [
+            (state, now, message_id, DELIVERY_STATES.index(state) + 1)
+            for message_id, state in updates
+            if state in DELIVERY_STATES
+        ]
+        self._write(
+            f"UPDATE messages SET delivery = ?, delivery_updated = ? WHERE provider_id = ? AND {DELIVERY_RANK} < ?",
+            rows,
+        )
+
+    # ONE PAGE OF (row id, provider id) FOR SENT MESSAGES WITHOUT A FINAL RECEIPT,
+    # SENT AFTER since; PASS THE LAST ROW ID BACK AS after FOR THE NEXT PAGE
+    # only messages sent through shard when one is given
+    def awaiting_delivery(self, since, after=0, limit=100, shard=None):
+        where = "" if shard is None else " AND shard = ?"
+        args = (after, since) + (() if shard is None else (shard,)) + (limit,)
+        return [
+            (row["id"], row["provider_id"])
+            for row in self._read(
+                "SELECT id, provider_id FROM messages WHERE status = 'sent' AND id > ? AND updated >= ?"
+                f" AND provider_id IS NOT NULL AND COALESCE(delivery, '') NOT IN {FINAL_DELIVERY_STATES}{where}"
+                " ORDER BY id LIMIT ?", args
+            )
+        ]
+
+    # MESSAGES OF A BATCH PER DELIVERY STATE ('unknown' UNTIL A RECEIPT ARRIVES)
+    def deliveries(self, batch_id):
+        counts = {state: 0 for state in ["unknown"] + DELIVERY_STATES}
+        for row in self._read(
+            "SELECT COALESCE(delivery, 'unknown') AS delivery, COUNT(*) AS n FROM messages"
+            " WHERE batch_id = ? AND status = 'sent' GROUP BY 1", (batch_id,)
+        ):
+            counts[row["delivery"]] = row["n"]
+        return counts
+
+    def batch(self, batch_id):
+        rows = self._read("SELECT * FROM batches WHERE id = ?", (batch_id,))
+        return dict(rows[0]) if rows else None
+
+# BACKGROUND THREAD KEEPING THIS PROCESS'S SENDING LEASE ON AN OUTBOX
+# with two processes sending, each would reset the other's in-flight messages
+# on start and each has its own rate limits, so together they would go over the
+# provider's; the holder alone sends, the others only queue until it is gone
+# route and shards are the holder's devices (see shards.SenderPool): messages
+# queued by a process with other devices are routed onto them again
+class OutboxLease(threading.Thread):
+    def __init__(self, outbox, ledger=None, route=None, shards=(None,)):
+        super().__init__(name="outbox-lease", daemon=True)
+        self.outbox = outbox
+        self.ledger = ledger or Ledger()
+        self.route = route
+        self.shards = list(shards)
+        self.held = threading.Event()
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.renew()
+            self.stopping.wait(HEARTBEAT_INTERVAL)
+        self.held.clear()
+        self.outbox.release_lease()
+
+    def renew(self):
+        if not self.outbox.take_lease():
+            self.held.clear()
+            return
+        moved = self.outbox.reshard(self.route, self.shards)
+        if not self.held.is_set():
+            # taken over: whatever the previous holder was sending goes back in the queue
+            self.ledger.clear_reserved(self.outbox.owner)
+            self.outbox.recover()
+            self.held.set()
+            self.outbox.notify()
+        elif moved:
+            self.outbox.notify()
+
+    def stop(self):
+        self.stopping.set()
+
+# BACKGROUND THREAD THAT DRAINS THE OUTBOX (OR ONE SHARD OF IT) THROUGH dispatch()
+# send(phone, message, file_id) must raise or return None on failure
+# workers of one process share one lease; without one the worker starts its own
+# a second lane claims only single messages, so they go out while a bulk claim
+# is still being sent
+class OutboxWorker(threading.Thread):
+    def __init__(self, outbox, send, max_in_flight=MAX_IN_FLIGHT, ledger=None, pacer=None, shard=None, lease=None):
+        super().__init__(name="outbox-worker" + (f"-{shard}" if shard else ""), daemon=True)
+        self.outbox = outbox
+        self.send = send
+        self.max_in_flight = max_in_flight
+        self.ledger = ledger or Ledger()
+        self.pacer = pacer or BulkPacer()
+        self.shard = shard
+        self.lease = lease
+        self.has_work = outbox.subscribe()
+        self.has_priority_work = outbox.subscribe()
+        self.stopping = threading.Event()
+        self.last_prune = 0.0
+
+    def run(self):
+        if self.lease is None:
+            # alone on the outbox: every message is this worker's
+            self.lease = OutboxLease(self.outbox, self.ledger, lambda phone: self.shard, [self.shard])
+            self.lease.start()
+        lane = threading.Thread(
+            target=self.drain, args=(self.has_priority_work, PRIORITY_IN_FLIGHT, True),
+            name=self.name + "-priority", daemon=True,
+        )
+        lane.start()
+        self.drain(self.has_work, self.max_in_flight)
+        lane.join()
+
+    # CLAIM AND SEND UNTIL STOPPED; priority_only CLAIMS NO BULK MESSAGES
+    def drain(self, has_work, max_in_flight, priority_only=False):
+        while not self.stopping.is_set():
+            if not self.lease.held.is_set():
+                self.lease.held.wait(POLL_INTERVAL)
+                continue
+            if not priority_only and time.time() - self.last_prune > PRUNE_INTERVAL:
+                self.ledger.prune()
+                self.last_prune = time.time()
+            # cleared before claiming, so a batch queued during the claim is not missed
+            has_work.clear()
+            # claim a few rounds of work at once so the pool stays busy
+            limit = max_in_flight * 4
+            rows = self.outbox.claim(limit, 0 if priority_only else self.pacer.allowance(limit), self.shard)
+            if not rows:
+                has_work.wait(POLL_INTERVAL)
+                continue
+            with profiled("send"):
+                self.send_rows(rows, max_in_flight)
+
+    # SEND ONLY WHAT THE LEDGER HAS NOT SEEN DELIVERED FOR THIS BATCH KEY
+    def send_rows(self, rows, max_in_flight=None):
+        entries = [(row["batch_key"], row["phone"], content_hash(row["message"], row["file_id"])) for row in rows]
+        reserved = [self.ledger.reserve(*entry, self.outbox.owner) for entry in entries]
+        self.outbox.skip([row for row, ok in zip(rows, reserved) if not ok])
+        rows = [row for row, ok in zip(rows, reserved) if ok]
+        entries = [entry for entry, ok in zip(entries, reserved) if ok]
+
+        jobs = [(row["phone"], row["message"], row["file_id"]) for row in rows]
+        # results are written back every PROGRESS_INTERVAL, so progress and
+        # failures show up while the rest of the claim is still being sent
+        results = [None] * len(rows)
+        finished = []
+        last_flush = time.monotonic()
+
+        def on_result(i, result):
+            nonlocal last_flush
+            results[i] = result
+            finished.append(i)
+            if time.monotonic() - last_flush >= PROGRESS_INTERVAL:
+                self.finish(rows, entries, results, finished)
+                finished.clear()
+                last_flush = time.monotonic()
+
+        dispatch(self.send, jobs, max_in_flight or self.max_in_flight, on_result)
+        self.finish(rows, entries, results, finished)
+
+    # LEDGER AND OUTBOX UPDATES FOR THE FINISHED INDEXES OF A CLAIM
+    def finish(self, rows, entries, results, indexes):
+        if not indexes:
+            return
+        self.ledger.delivered([entries[i] for i in indexes if not results[i]["error"]])
+        self.ledger.release([entries[i] for i in indexes if results[i]["error"]])
+        self.outbox.complete([rows[i] for i in indexes], [results[i] for i in indexes])
+
+    def stop(self):
+        self.stopping.set()
+        self.has_work.set()
+        self.has_priority_work.set()
@@ -0,0 +1,63 @@
+import os
+import pandas as pd
+
+# PHONE NUMBERS FROM THE SHEETS -> E.164 ("+919876543210"), CHECKED BEFORE ANY
+# MESSAGE IS QUEUED SO NO REQUEST IS SPENT ON A NUMBER THAT CAN NEVER BE REACHED
+
+# country code added to national numbers
+DEFAULT_COUNTRY_CODE = os.environ.get("DEFAULT_COUNTRY_CODE", "91").lstrip("+")
+# digits of a national number in the default country (without trunk prefix 0)
+NATIONAL_DIGITS = int(os.environ.get("PHONE_NATIONAL_DIGITS", 10))
+
+# E.164 NUMBERS FOR A WHOLE COLUMN, NaN WHERE A NUMBER IS MISSING OR INVALID
+# accepts ints, floats from sheets with blank cells (9876543210.0), formatted
+# text ("+91 98765-43210", "0091...", "098765 43210") and numbers that already
+# carry the country code without a "+"
+def normalize_phones(phones):
+    text = phones.astype("string").str.strip()
+    text = text.str.replace(r"\.0+$", "", regex=True)
+    international = text.str.startswith("+") | text.str.startswith("00")
+    digits = text.str.replace(r"\D", "", regex=True)
+    digits = digits.where(~text.str.startswith("00"), digits.str[2:])
+
+    # national numbers: drop a trunk 0, then add the default country code
+    # (or keep it when the number already starts with it), other lengths are invalid
+    national = digits.str.replace(r"^0", "", regex=True)
+    length = national.str.len()
+    coded = (length == len(DEFAULT_COUNTRY_CODE) + NATIONAL_DIGITS) & national.str.startswith(DEFAULT_COUNTRY_CODE)
+    national = national.where(coded, (DEFAULT_COUNTRY_CODE + national).where(length == NATIONAL_DIGITS))
+    e164 = digits.where(international, national)
+
+    # E.164: at most 15 digits, no leading 0
+    valid = e164.str.fullmatch(r"[1-9]\d{7,14}").fillna(False).astype(bool)
+    return ("+" + e164).astype(object).where(valid)
+
+def normalize_phone(phone):
+    return normalize_phones(pd.Series([phone])).iloc[0]
+
+# SPLIT ROWS INTO SENDABLE ONES AND A REPORT OF THE ONES THAT ARE NOT
+# returns (rows with valid numbers, column replaced by its E.164 form;
+#          report with the sheet row, the original value and the problem)
+# dedupe drops later rows whose number (plus the dedupe columns) repeats
+def preflight(data, column="Phone Number", dedupe=None):
+    phones = normalize_phones(data[column])
+    original = data[column]
+    missing = original.isna() | (original.astype("string").str.strip() == "")
+    problems = pd.Series(None, index=data.index, dtype=object)
+    problems[phones.isna()] = "invalid number"
+    problems[missing] = "missing number"
+
+    checked = data.assign(**{column: phones})
+    if dedupe is not None:
+        keys = [column] + list(dedupe)
+        repeated = checked[column].notna() & checked.duplicated(subset=keys)
+        problems[repeated] = "duplicate"
+
+    bad = problems.notna()
+    report = pd.DataFrame({
+        # header row is row 1 in Excel
+        "row": pd.Series([data.index.get_loc(i) + 2 for i in data.index[bad]], dtype="int64"),
+        "value": original[bad].astype("string").fillna("").tolist(),
+        "problem": problems[bad].tolist(),
+    })
+    return checked[~bad], report
@@ -0,0 +1,131 @@
+import os
+import io
+import glob
+import time
+import pstats
+import cProfile
+import threading
+from functools import wraps
+from collections import deque
+from contextlib import contextmanager
+
+# OPT-IN cProfile OF EVERY STREAMLIT RERUN AND BATCH SEND
+# PROFILE=1 turns it on; each profile is saved to PROFILE_DIR as a .prof file
+# (open with `python -m pstats` or snakeviz) and summarized for the app
+# work a block hands to pool threads (see dispatch.py) is profiled on each
+# thread and merged into the block's profile
+
+PROFILE = os.environ.get("PROFILE", "") not in ("", "0", "false")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".profiles")
+# hot functions kept per summary
+TOP_N = int(os.environ.get("PROFILE_TOP", 15))
+# summaries kept in memory for the app
+KEEP = 20
+# .prof files kept in PROFILE_DIR, oldest are deleted first
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 50))
+
+_summaries = deque(maxlen=KEEP)
+_summaries_lock = threading.Lock()
+# the profile running on this thread, nested calls join it
+_active = threading.local()
+
+# TOP_N FUNCTIONS BY CUMULATIVE TIME OF A pstats.Stats
+def top_functions(stats, limit=TOP_N):
+    rows = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": calls,
+            "own_s": round(tottime, 4),
+            "total_s": round(cumtime, 4),
+        })
+    rows.sort(key=lambda row: row["total_s"], reverse=True)
+    return rows[:limit]
+
+# PROFILE THE BLOCK WHEN PROFILE IS ON, name ENDS UP IN THE FILE NAME
+# a block inside an already profiled block adds its name to that profile
+@contextmanager
+def profiled(name):
+    if not PROFILE:
+        yield
+        return
+    session = getattr(_active, "session", None)
+    if session is not None:
+        session["names"].append(name)
+        yield
+        return
+
+    # names of the nested blocks and profiles of the pool threads, see profile_threads()
+    _active.session = session = {"names": [name], "threads": [], "lock": threading.Lock()}
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _active.session = None
+        elapsed = time.perf_counter() - start
+        label = "-".join(dict.fromkeys(session["names"]))
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        with session["lock"]:
+            for thread_profile in session["threads"]:
+                stats.add(thread_profile)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(start * 1000) % 1000:03d}-{label}.prof")
+        stats.dump_stats(path)
+        _prune(PROFILE_DIR, PROFILE_KEEP)
+        with _summaries_lock:
+            _summaries.appendleft({
+                "name": label,
+                "seconds": elapsed,
+                "path": path,
+                "top": top_functions(stats),
+            })
+
+# function WRAPPED TO BE PROFILED ON WHATEVER THREAD RUNS IT, INTO THE BLOCK
+# PROFILED ON THIS THREAD; function ITSELF WHEN NOTHING IS BEING PROFILED HERE
+# wrap before handing work to a pool, the block must outlast the pool's work
+def profile_threads(function):
+    session = getattr(_active, "session", None)
+    if session is None:
+        return function
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # blocks profiled by function join the caller's profile
+        _active.session = session
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            _active.session = None
+            with session["lock"]:
+                session["threads"].append(profile)
+    return wrapper
+
+# DELETE ALL BUT THE keep NEWEST .prof FILES OF directory
+def _prune(directory, keep):
+    paths = sorted(glob.glob(os.path.join(directory, "*.prof")), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# DECORATOR FORM OF profiled()
+def profile_calls(name):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with profiled(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# MOST RECENT PROFILES FIRST
+def summaries():
+    with _summaries_lock:
+        return list(_summaries)
@@ -0,0 +1,38 @@
+# LIVE COUNTS, THROUGHPUT AND ETA OF A BATCH BEING SENT
+
+# messages per second are measured over the last RATE_WINDOW seconds
+RATE_WINDOW = 10.0
+
+# MESSAGES PER SECOND FROM COMPLETION TIMES
+# recent completions in the window, or the whole batch once it is finished
+def send_rate(recent, first, last, now, done=False, window=RATE_WINDOW):
+    if first is None:
+        return None
+    if done:
+        return recent / (last - first) if last > first else None
+    span = min(window, now - first)
+    return recent / span if span > 0 else None
+
+# SECONDS LEFT AT THE CURRENT RATE, NONE WHILE THERE IS NO RATE YET
+def eta(remaining, rate):
+    if not remaining:
+        return 0.0
+    return remaining / rate if rate else None
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+# ONE LINE SUMMARY; counts HAS sent, failed, total AND OPTIONALLY skipped, rate, eta
+def progress_text(label, counts):
+    text = f"{label}: {counts['sent']} of {counts['total']} sent, {counts['failed']} failed"
+    if counts.get("skipped"):
+        text += f", {counts['skipped']} already sent"
+    if counts.get("rate"):
+        text += f" · {counts['rate']:.1f} msg/s"
+    if not counts.get("done"):
+        text += f" · ETA {format_eta(counts.get('eta'))}"
+    return text
@@ -0,0 +1,146 @@
+import os
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dispatch import MAX_IN_FLIGHT
+from ratelimit import THROTTLE_STATUS, get_limiter, retry_after
+from metrics import PROVIDER_LATENCY, PROVIDER_RESPONSES
+
+# PROVIDER URLS (base URLs can be pointed at a local mock server)
+
+WASSENGER_URL = os.environ.get("WASSENGER_URL", "https://api.wassenger.com/v1")
+WASSENGER_MSG_URL = WASSENGER_URL + "/messages"
+WASSENGER_FILE_URL = WASSENGER_URL + "/files"
+HYPERSENDER_URL = os.environ.get("HYPERSENDER_URL", "https://app.hypersender.com/api/whatsapp/v1")
+
+# CONNECTION POOL & TIMEOUTS
+
+# keep at least one pooled connection per dispatch worker
+POOL_SIZE = int(os.environ.get("PROVIDER_POOL_SIZE", max(10, MAX_IN_FLIGHT)))
+# (connect, read) seconds
+TIMEOUT = (5, 30)
+UPLOAD_TIMEOUT = (5, 120)
+# retries of a throttled (429 / 503) request before giving up
+MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", 5))
+
+# ONE POOLED, KEEP-ALIVE SESSION SHARED BY ALL PROVIDER CALLS
+class ProviderClient:
+    def __init__(self, wassenger_key=None, hypersender_id=None, hypersender_token=None, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # auth headers are built once, not per message
+        self.wassenger_headers = {
+            "Content-Type": "application/json",
+            "Token": wassenger_key or ""
+        }
+        self.wassenger_file_headers = {"Token": wassenger_key or ""}
+        self.hypersender_headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": "Bearer " + (hypersender_token or "")
+        }
+        self.hypersender_text_url = f"{HYPERSENDER_URL}/{hypersender_id}/send-text-safe"
+
+        # rate limits (and uploaded files) are per API key / device
+        self.wassenger_account = _label(wassenger_key)
+        self.wassenger_limiter = get_limiter("wassenger:" + self.wassenger_account)
+        # only clients with a Hypersender device get its limiter (and a row in the app's sidebar)
+        self.hypersender_limiter = get_limiter("hypersender:" + _label(hypersender_id)) if hypersender_id else None
+
+    # RATE-LIMITED REQUEST, RETRIED AFTER 429 / 503 INSTEAD OF LOSING THE MESSAGE
+    def request(self, method, url, headers, limiter, timeout=None, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            limiter.acquire()
+            # e.g. "POST messages" (sends) and "GET messages" (status polls) are kept apart
+            endpoint = method + " " + url.rsplit("/", 1)[-1]
+            try:
+                with PROVIDER_LATENCY.time(endpoint=endpoint):
+                    response = self.session.request(method, url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException:
+                PROVIDER_RESPONSES.inc(endpoint=endpoint, status="error")
+                raise
+            PROVIDER_RESPONSES.inc(endpoint=endpoint, status=response.status_code)
+            if response.status_code in THROTTLE_STATUS and attempt < MAX_RETRIES:
+                limiter.on_throttle(retry_after(response))
+                _rewind(kwargs.get("files"))
+                continue
+            response.raise_for_status()
+            limiter.on_success()
+            return response
+
+    def post(self, url, headers, limiter, timeout=None, **kwargs):
+        return self.request("POST", url, headers, limiter, timeout, **kwargs)
+
+    # WASSENGER: TEXT OR MEDIA MESSAGE
+    def send_message(self, phone, message, file_id=None):
+        payload = {
+            "phone": phone,
+            "message": message
+        }
+        if file_id:
+            payload["media"] = {"file": file_id}
+        return self.post(WASSENGER_MSG_URL, self.wassenger_headers, self.wassenger_limiter, json=payload).json()
+
+    # WASSENGER: UPLOAD FILE, RETURN FILE ID
+    def upload_file(self, name, data, mime_type):
+        files = {"file": (name, data, mime_type)}
+        response = self.post(WASSENGER_FILE_URL, self.wassenger_file_headers, self.wassenger_limiter, timeout=UPLOAD_TIMEOUT, files=files)
+        return response.json()[0]["id"]
+
+    # WASSENGER: DELIVERY STATUS OF SENT MESSAGES, ONE REQUEST FOR A WHOLE PAGE OF IDS
+    # returns {message id: status}; ids the provider no longer knows are left out
+    def message_statuses(self, ids):
+        params = {"ids": ",".join(ids), "size": len(ids)}
+        response = self.request("GET", WASSENGER_MSG_URL, self.wassenger_file_headers, self.wassenger_limiter, params=params)
+        return {
+            item["id"]: item.get("deliveryStatus") or item.get("status")
+            for item in response.json()
+            if item.get("id")
+        }
+
+    # HYPERSENDER: TEXT MESSAGE
+    def send_text_safe(self, phone, text, link_preview=True):
+        if self.hypersender_limiter is None:
+            raise ValueError("No Hypersender device configured (HYPERSENDER_ID).")
+        payload = {
+            "chatId": phone.lstrip("+") + "@c.us",
+            "text": text,
+            "link_preview": link_preview
+        }
+        return self.post(self.hypersender_text_url, self.hypersender_headers, self.hypersender_limiter, json=payload)
+
+    def close(self):
+        self.session.close()
+
+# SHORT, NON-SECRET LABEL FOR AN API KEY / DEVICE ID
+def _label(key):
+    return hashlib.sha1((key or "").encode()).hexdigest()[:8]
+
+# SEEK UPLOADED FILE OBJECTS BACK TO THE START BEFORE A RETRY
+def _rewind(files):
+    for value in (files or {}).values():
+        data = value[1] if isinstance(value, tuple) else value
+        if hasattr(data, "seek"):
+            data.seek(0)
+
+# PROCESS-WIDE CLIENT FROM ENVIRONMENT VARIABLES
+# (the app and cli.py use the per-device clients of messaging.get_senders())
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ProviderClient(
+                os.environ.get("WASSENGER_API"),
+                os.environ.get("HYPERSENDER_ID"),
+                os.environ.get("HYPERSENDER_API"),
+            )
+        return _client
@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+# DEFAULT LIMITS (messages per second, per API key / device)
+
+START_RATE = float(os.environ.get("PROVIDER_RATE", 5))
+MIN_RATE = float(os.environ.get("PROVIDER_MIN_RATE", 0.2))
+MAX_RATE = float(os.environ.get("PROVIDER_MAX_RATE", 20))
+BURST = float(os.environ.get("PROVIDER_BURST", 5))
+# added to the rate after every successful request
+RAMP_STEP = 0.05
+# multiplied into the rate on 429 / 503
+BACKOFF = 0.5
+# used when a 429 / 503 arrives without a Retry-After header
+DEFAULT_RETRY_AFTER = 1.0
+
+THROTTLE_STATUS = (429, 503)
+
+# ADAPTIVE TOKEN BUCKET: SLOWS DOWN ON THROTTLING, RAMPS BACK UP ON SUCCESS
+class TokenBucket:
+    def __init__(self, rate=START_RATE, burst=BURST, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.sent = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.last:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+    # BLOCK UNTIL A REQUEST MAY BE MADE
+    def acquire(self):
+        with self.lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now >= self.blocked_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+                time.sleep(wait)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    # NON-BLOCKING: TAKE UP TO most WHOLE TOKENS, RETURNS HOW MANY WERE TAKEN
+    def take(self, most):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return 0
+            taken = max(0, min(most, int(self.tokens)))
+            self.tokens -= taken
+            return taken
+
+    # FOLLOW A RATE DECIDED ELSEWHERE (SEE scheduler.BulkPacer)
+    def set_rate(self, rate, burst):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            self.burst = max(1.0, burst)
+            self.tokens = min(self.tokens, self.burst)
+
+    def on_success(self):
+        with self.lock:
+            self.sent += 1
+            self.rate = min(self.max_rate, self.rate + RAMP_STEP)
+
+    # PROVIDER SAID SLOW DOWN: HALVE THE RATE AND PAUSE FOR retry_after SECONDS
+    def on_throttle(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self.throttled += 1
+            # requests already in flight when the pause began report the same
+            # throttling event, only the first one slows the bucket down
+            if now < self.blocked_until:
+                return
+            self.rate = max(self.min_rate, self.rate * BACKOFF)
+            pause = DEFAULT_RETRY_AFTER if retry_after is None else retry_after
+            self.blocked_until = max(self.blocked_until, now + pause)
+            self.tokens = 0
+            self.last = self.blocked_until
+
+    def state(self):
+        with self.lock:
+            return {
+                "rate": round(self.rate, 2),
+                "queue_depth": self.waiting,
+                "paused_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                "sent": self.sent,
+                "throttled": self.throttled,
+            }
+
+# PARSE A Retry-After HEADER (SECONDS OR HTTP DATE), NONE IF ABSENT / INVALID
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# ONE BUCKET PER API KEY / DEVICE, SHARED BY EVERY CLIENT IN THE PROCESS
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(key):
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = TokenBucket()
+        return _limiters[key]
+
+def limiter_states():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {key: limiter.state() for key, limiter in limiters.items()}
@@ -0,0 +1,57 @@
+import pandas as pd
+from phones import normalize_phones
+from templates import get_templates
+
+# BUILD EVERY IA MARKS MESSAGE IN ONE PASS OVER THE MERGED FRAME
+# data is the students info merged with the marks on USN, title is e.g. "I.A. 1"
+# the text comes from the 'ia_marks' templates (see templates.py), in each row's language
+# returns a frame with 'phone' (E.164, NaN when invalid) and 'body' columns aligned with data's rows
+def render_ia_messages(data, subjects, title):
+    return pd.DataFrame({
+        "phone": normalize_phones(data["Phone Number"]),
+        "body": get_templates().render("ia_marks", data, subjects=subjects, title=title),
+    }, index=data.index)
+
+# (phone, body) RECORDS READY FOR THE OUTBOX, ROWS WITHOUT A VALID NUMBER ARE LEFT OUT
+def ia_jobs(data, subjects, title):
+    rendered = render_ia_messages(data, subjects, title).dropna(subset=["phone"])
+    return list(zip(rendered["phone"], rendered["body"]))
+
+# RENDER BENCHMARK: PER-ROW .loc LOOKUPS VS ONE PASS OF THE COMPILED TEMPLATES
+# python render.py [students] [subjects]
+if __name__ == "__main__":
+    import sys
+    import time
+    import numpy as np
+
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    n_subjects = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    subjects = [f"Subject {j + 1}" for j in range(n_subjects)]
+    data = pd.DataFrame({
+        "USN": [f"1XX{i:05d}" for i in range(students)],
+        "Student Name": [f"Student {i}" for i in range(students)],
+        "Phone Number": np.arange(9000000000, 9000000000 + students),
+    })
+    for subject in subjects:
+        data[subject] = np.random.randint(0, 51, students)
+
+    start = time.perf_counter()
+    looped = []
+    for i in data.index:
+        name = data.loc[i, ['Student Name']].item()
+        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
+        student_marks = [data.loc[i, j] for j in subjects]
+        message = f'Dear Parent, \nThis message is regarding the I.A. 1 marks of your ward, {name}.\n'
+        message += '\n'.join([f'{subject}: {marks}' for subject, marks in zip(subjects, student_marks)])
+        message += '\nThank you.'
+        looped.append((p_no, message))
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = ia_jobs(data, subjects, "I.A. 1")
+    vector_time = time.perf_counter() - start
+
+    assert looped == vectorized
+    print(f"{students} students x {n_subjects} subjects")
+    print(f"per-row .loc: {loop_time:.3f}s")
+    print(f"vectorized:   {vector_time:.3f}s ({loop_time / vector_time:.0f}x faster)")
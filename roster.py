@@ -0,0 +1,298 @@
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from metrics import EXCEL_PARSE
+
+# PARSED SHEETS ARE KEPT IN MEMORY AND AS SIDECAR FILES NEXT TO EACH OTHER
+# IN CACHE_DIR, SO A WORKBOOK IS ONLY PARSED BY openpyxl ONCE
+
+CACHE_DIR = os.environ.get("ROSTER_CACHE_DIR", ".roster_cache")
+MEMORY_BUDGET = int(os.environ.get("ROSTER_MEMORY_MB", 256)) * 1024 * 1024
+DISK_BUDGET = int(os.environ.get("ROSTER_DISK_MB", 1024)) * 1024 * 1024
+
+# WHAT IDENTIFIES A WORKBOOK: PATH + MTIME + SIZE FOR FILES ON DISK,
+# CONTENT HASH FOR UPLOADS; RETURNS (key, bytes or None)
+def source_key(source):
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        ident = f"{os.path.abspath(source)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+        return hashlib.sha256(ident.encode()).hexdigest(), None
+    if hasattr(source, "getvalue"):
+        data = source.getvalue()
+    else:
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+    return hashlib.sha256(data).hexdigest(), data
+
+def _sheet_id(key, sheet_name):
+    return hashlib.sha256(f"{key}\0{sheet_name!r}".encode()).hexdigest()[:32]
+
+# EXPECTED LAYOUT: 'sem N' SHEETS HOLD STUDENT INFORMATION, 'IA N' SHEETS HOLD MARKS
+
+SEMESTER_COLUMNS = ["USN", "Student Name", "Phone Number"]
+IA_COLUMNS = ["USN"]
+SHEET_PATTERN = re.compile(r"(sem|ia)\s*(\d+)", re.IGNORECASE)
+
+# EVERY SHEET OF ONE WORKBOOK, PARSED IN A SINGLE PASS
+class Workbook:
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.semesters = {}
+        self.ias = {}
+        self.problems = []
+        for name, frame in sheets.items():
+            match = SHEET_PATTERN.fullmatch(name.strip())
+            if not match:
+                continue
+            kind, number = match.group(1).lower(), int(match.group(2))
+            if kind == "sem":
+                self.semesters[number] = frame
+                self._check(name, frame, SEMESTER_COLUMNS)
+            else:
+                self.ias[number] = frame
+                self._check(name, frame, IA_COLUMNS)
+                if len(frame.columns) < 2:
+                    self.problems.append(f"Sheet '{name}' has no subject columns.")
+
+    def _check(self, name, frame, columns):
+        missing = [column for column in columns if column not in frame.columns]
+        if missing:
+            self.problems.append(f"Sheet '{name}' is missing column(s): {', '.join(missing)}.")
+
+    def semester(self, number):
+        if number not in self.semesters:
+            raise KeyError(f"Workbook has no 'sem {number}' sheet.")
+        return self.semesters[number]
+
+# KEYS USED BY THE LOOKUP INDEX
+
+def normalize_usn(usn):
+    return str(usn).strip().upper()
+
+def normalize_name(name):
+    return " ".join(str(name).split()).casefold()
+
+# O(1) STUDENT LOOKUPS FOR ONE ROSTER SHEET: USN -> RECORD, NAME -> RECORDS
+class RosterIndex:
+    def __init__(self, frame):
+        self.usns = {}
+        self.names = {}
+        self.duplicate_usns = set()
+        for record in frame.to_dict("records"):
+            if "USN" in record:
+                usn = normalize_usn(record["USN"])
+                if usn in self.usns:
+                    self.duplicate_usns.add(usn)
+                self.usns[usn] = record
+            if "Student Name" in record:
+                self.names.setdefault(normalize_name(record["Student Name"]), []).append(record)
+        self.duplicate_names = {name for name, records in self.names.items() if len(records) > 1}
+
+    def by_usn(self, usn):
+        return self.usns.get(normalize_usn(usn))
+
+    def by_name(self, name):
+        return self.names.get(normalize_name(name), [])
+
+# LRU OF PARSED SHEETS WITH A MEMORY AND A DISK BUDGET
+# returned frames are shared between reruns, treat them as read-only
+class RosterCache:
+    def __init__(self, cache_dir=CACHE_DIR, memory_budget=MEMORY_BUDGET, disk_budget=DISK_BUDGET):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.frames = OrderedDict()
+        self.indexes = {}
+        self.manifests = {}
+        self.memory_used = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def read_sheet(self, source, sheet_name=0):
+        return self._load(source, sheet_name)[1]
+
+    # ALL SHEETS OF A WORKBOOK; PARSES THE FILE AT MOST ONCE
+    def read_workbook(self, source):
+        key, data = source_key(source)
+        names = self._manifest(key)
+        if names is None:
+            self._parse(key, data, source)
+            names = self._manifest(key)
+        return Workbook({name: self._load(source, name)[1] for name in names})
+
+    # LOOKUP INDEX, BUILT ONCE PER CACHED SHEET
+    def read_index(self, source, sheet_name=0):
+        sheet_id, frame = self._load(source, sheet_name)
+        with self.lock:
+            index = self.indexes.get(sheet_id)
+        if index is None:
+            index = RosterIndex(frame)
+            with self.lock:
+                # only kept while the sheet itself is in the memory tier
+                if sheet_id in self.frames:
+                    self.indexes[sheet_id] = index
+        return index
+
+    def _load(self, source, sheet_name):
+        key, data = source_key(source)
+        if isinstance(sheet_name, int):
+            # sheet positions are resolved to names through the workbook manifest
+            names = self._manifest(key)
+            if names is None:
+                self._parse(key, data, source)
+                names = self._manifest(key)
+            sheet_name = names[sheet_name]
+        sheet_id = _sheet_id(key, sheet_name)
+
+        frame = self._from_memory(sheet_id)
+        if frame is None:
+            frame = self._from_disk(sheet_id)
+            if frame is None:
+                names = self._manifest(key)
+                if names is not None and sheet_name not in names:
+                    raise ValueError(f"Worksheet named '{sheet_name}' not found")
+                # never parsed, or its sidecar was trimmed from the disk tier
+                frames = self._parse(key, data, source)
+                if sheet_name not in frames:
+                    raise ValueError(f"Worksheet named '{sheet_name}' not found")
+                frame = frames[sheet_name]
+            self._to_memory(sheet_id, frame)
+        return sheet_id, frame
+
+    # ONE openpyxl PASS OVER THE WHOLE WORKBOOK; EVERY SHEET GOES TO THE DISK TIER
+    def _parse(self, key, data, source):
+        with EXCEL_PARSE.time():
+            frames = pd.read_excel(io.BytesIO(data) if data is not None else source, sheet_name=None)
+        for name, frame in frames.items():
+            self._to_disk(_sheet_id(key, name), frame)
+        names = list(frames)
+        with open(self._manifest_path(key), "w") as f:
+            json.dump(names, f)
+        with self.lock:
+            self.manifests[key] = names
+        self._trim_disk()
+        return frames
+
+    # SHEET NAMES OF A PARSED WORKBOOK, IN ORDER; NONE IF NEVER PARSED
+    def _manifest(self, key):
+        with self.lock:
+            if key in self.manifests:
+                return self.manifests[key]
+        path = self._manifest_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            names = json.load(f)
+        os.utime(path)
+        with self.lock:
+            self.manifests[key] = names
+        return names
+
+    def _manifest_path(self, key):
+        return os.path.join(self.cache_dir, key[:32] + ".sheets.json")
+
+    # MEMORY TIER
+
+    def _from_memory(self, sheet_id):
+        with self.lock:
+            if sheet_id not in self.frames:
+                return None
+            self.frames.move_to_end(sheet_id)
+            return self.frames[sheet_id][0]
+
+    def _to_memory(self, sheet_id, frame):
+        size = int(frame.memory_usage(deep=True).sum())
+        with self.lock:
+            if sheet_id in self.frames:
+                return
+            self.frames[sheet_id] = (frame, size)
+            self.memory_used += size
+            # always keep the newest sheet, even if it alone is over budget
+            while self.memory_used > self.memory_budget and len(self.frames) > 1:
+                evicted_id, (_, evicted) = self.frames.popitem(last=False)
+                self.indexes.pop(evicted_id, None)
+                self.memory_used -= evicted
+
+    # DISK TIER: PARQUET, OR PICKLE FOR COLUMNS ARROW CANNOT STORE (MIXED TYPES)
+
+    def _sidecars(self, sheet_id):
+        base = os.path.join(self.cache_dir, sheet_id)
+        return base + ".parquet", base + ".pkl"
+
+    def _from_disk(self, sheet_id):
+        parquet, pickle = self._sidecars(sheet_id)
+        for path, read in ((parquet, pd.read_parquet), (pickle, pd.read_pickle)):
+            if os.path.exists(path):
+                try:
+                    frame = read(path)
+                except Exception:
+                    os.remove(path)
+                    continue
+                os.utime(path)
+                return frame
+        return None
+
+    def _to_disk(self, sheet_id, frame):
+        parquet, pickle = self._sidecars(sheet_id)
+        try:
+            frame.to_parquet(parquet)
+        except Exception:
+            if os.path.exists(parquet):
+                os.remove(parquet)
+            frame.to_pickle(pickle)
+
+    # DROP THE LEAST RECENTLY USED SIDECARS UNTIL UNDER THE DISK BUDGET
+    def _trim_disk(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if used <= self.disk_budget:
+                break
+            os.remove(path)
+            used -= size
+
+# RERUN LATENCY: openpyxl PARSE VS CACHED READS
+# python roster.py [rows]
+if __name__ == "__main__":
+    import sys
+    import time
+    import shutil
+    import tempfile
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workdir = tempfile.mkdtemp()
+    workbook = os.path.join(workdir, "students.xlsx")
+    pd.DataFrame({
+        "USN": [f"1XX{i:05d}" for i in range(rows)],
+        "Student Name": [f"Student {i}" for i in range(rows)],
+        "Phone Number": range(9000000000, 9000000000 + rows),
+    }).to_excel(workbook, sheet_name="sem 1", index=False)
+
+    start = time.perf_counter()
+    pd.read_excel(workbook, sheet_name="sem 1")
+    print(f"pd.read_excel:   {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    cache = RosterCache(os.path.join(workdir, "cache"))
+    start = time.perf_counter()
+    cache.read_sheet(workbook, "sem 1")
+    print(f"first read:      {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    start = time.perf_counter()
+    cache.read_sheet(workbook, "sem 1")
+    print(f"memory hit:      {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    cache = RosterCache(os.path.join(workdir, "cache"))
+    start = time.perf_counter()
+    cache.read_sheet(workbook, "sem 1")
+    print(f"sidecar hit:     {(time.perf_counter() - start) * 1000:8.1f} ms")
+    shutil.rmtree(workdir)
@@ -0,0 +1,74 @@
+import os
+import time
+from datetime import datetime, timedelta
+from ratelimit import MAX_RATE, MIN_RATE, TokenBucket
+
+# WHEN QUEUED MESSAGES MAY GO OUT
+# single parent messages are claimed first and are never held back; bulk
+# batches (IA marks, circulars) are paced, interleaved and kept to SEND_HOURS
+
+PRIORITY_MESSAGE = 10
+PRIORITY_BULK = 0
+
+# most bulk messages per second across all batches; 0 disables pacing
+BULK_RATE = float(os.environ.get("BULK_RATE", 0.8 * MAX_RATE))
+# share of the device's current rate limit bulk messages may use, the rest
+# stays free for single messages
+BULK_SHARE = float(os.environ.get("BULK_SHARE", 0.8))
+# local hours bulk messages may be sent in, e.g. "8-20" or "7:30-21"; empty: any time
+SEND_HOURS = os.environ.get("SEND_HOURS", "")
+
+def _hour(text):
+    hours, _, minutes = text.strip().partition(":")
+    return int(hours) + int(minutes or 0) / 60
+
+# "8-20" -> (8.0, 20.0), "" -> None; the window may wrap past midnight ("22-6")
+def parse_hours(text):
+    if not text or not text.strip():
+        return None
+    start, _, end = text.partition("-")
+    return _hour(start), _hour(end)
+
+def _hour_of(moment):
+    return moment.hour + moment.minute / 60 + moment.second / 3600
+
+def in_hours(timestamp, hours):
+    if hours is None:
+        return True
+    start, end = hours
+    hour = _hour_of(datetime.fromtimestamp(timestamp))
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+# EARLIEST TIME AT OR AFTER timestamp INSIDE THE WINDOW
+def next_allowed(timestamp, hours):
+    if in_hours(timestamp, hours):
+        return timestamp
+    moment = datetime.fromtimestamp(timestamp)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(hours=hours[0])
+    if start <= moment:
+        start += timedelta(days=1)
+    return start.timestamp()
+
+# HOW MANY BULK MESSAGES THE WORKER MAY CLAIM RIGHT NOW
+# limiter is the device's ratelimit.TokenBucket: it starts at PROVIDER_RATE and
+# halves on throttling, so bulk follows its current rate instead of claiming
+# more than the device can send
+class BulkPacer:
+    def __init__(self, rate=BULK_RATE, hours=parse_hours(SEND_HOURS), limiter=None):
+        self.rate = rate
+        self.hours = hours
+        self.limiter = limiter
+        # one second worth of messages can be claimed at once
+        self.bucket = TokenBucket(rate, burst=rate, min_rate=rate, max_rate=rate) if rate else None
+
+    def allowance(self, most):
+        if not in_hours(time.time(), self.hours):
+            return 0
+        if self.bucket is None:
+            return most
+        if self.limiter is not None:
+            rate = max(MIN_RATE, min(self.rate, BULK_SHARE * self.limiter.state()["rate"]))
+            self.bucket.set_rate(rate, burst=rate)
+        return self.bucket.take(most)
@@ -0,0 +1,73 @@
+import bisect
+import hashlib
+from functools import partial
+from provider import ProviderClient
+from outbox import OutboxLease, OutboxWorker
+from scheduler import BulkPacer
+
+# SEVERAL SENDING DEVICES (WASSENGER API KEYS) SHARING THE OUTBOX
+# every recipient is mapped to one device by consistent hashing, so a parent
+# keeps hearing from the same number and adding a device only moves the
+# recipients it takes over; each device has its own worker, pacing and rate limit
+
+# points per device on the hash ring, more points spread recipients more evenly
+REPLICAS = 160
+
+# WASSENGER_API="key1,key2,..." -> ["key1", "key2", ...]
+def sender_keys(value):
+    return [key.strip() for key in (value or "").split(",") if key.strip()]
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode()).digest()[:8], "big")
+
+class HashRing:
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self.points = [point for point, _ in self.ring]
+
+    def node(self, key):
+        i = bisect.bisect(self.points, _hash(key)) % len(self.ring)
+        return self.ring[i][1]
+
+# ONE PROVIDER CLIENT PER DEVICE, NAMED BY THE (NON-SECRET) LABEL OF ITS KEY
+class SenderPool:
+    def __init__(self, keys, **client_options):
+        if not keys:
+            raise ValueError("No sender API keys configured.")
+        self.clients = {}
+        for key in keys:
+            client = ProviderClient(key, **client_options)
+            self.clients[client.wassenger_account] = client
+        self.ring = HashRing(list(self.clients))
+
+    def __len__(self):
+        return len(self.clients)
+
+    # SHARD (DEVICE NAME) OF A RECIPIENT
+    def route(self, phone):
+        return self.ring.node(phone)
+
+    def client(self, shard):
+        return self.clients[shard]
+
+    # phone numbers grouped by shard
+    def split(self, phones):
+        groups = {}
+        for phone in phones:
+            groups.setdefault(self.route(phone), []).append(phone)
+        return groups
+
+    # START ONE WORKER PER DEVICE; send(phone, message, file_id, client=...) SENDS THROUGH client
+    # the workers share one lease, they send only while this process holds it
+    def start_workers(self, outbox, send, **worker_options):
+        lease = OutboxLease(outbox, route=self.route, shards=list(self.clients))
+        lease.start()
+        workers = []
+        for shard, client in self.clients.items():
+            worker = OutboxWorker(
+                outbox, partial(send, client=client), shard=shard, lease=lease,
+                pacer=BulkPacer(limiter=client.wassenger_limiter), **worker_options
+            )
+            worker.start()
+            workers.append(worker)
+        return workers
@@ -0,0 +1,53 @@
+import os
+import threading
+from requests.adapters import HTTPAdapter
+from dispatch import MAX_IN_FLIGHT, dispatch
+from metrics import TWILIO_LATENCY, TWILIO_RESPONSES
+
+# TWILIO SMS: ONE CLIENT PER PROCESS, BATCHES SENT THROUGH A BOUNDED WORKER POOL
+
+# keep at least one pooled connection per dispatch worker
+POOL_SIZE = int(os.environ.get("TWILIO_POOL_SIZE", max(10, MAX_IN_FLIGHT)))
+TIMEOUT = 30
+
+_client = None
+_from_number = None
+_client_lock = threading.Lock()
+
+def get_twilio_client():
+    global _client, _from_number
+    with _client_lock:
+        if _client is None:
+            from twilio.rest import Client
+            from twilio.http.http_client import TwilioHttpClient
+
+            account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
+            auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
+            from_number = os.environ.get("TWILIO_PHONE_NUMBER")
+            # validate environment variables
+            if not all([account_sid, auth_token, from_number]):
+                raise RuntimeError("Missing Twilio credentials in environment variables.")
+
+            http_client = TwilioHttpClient(pool_connections=True, timeout=TIMEOUT)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True)
+            http_client.session.mount("https://", adapter)
+            _client = Client(account_sid, auth_token, http_client=http_client)
+            _from_number = from_number
+        return _client, _from_number
+
+# SEND ONE SMS, RETURNS THE TWILIO MESSAGE SID AND STATUS
+def send_sms(phone, body):
+    client, from_number = get_twilio_client()
+    try:
+        with TWILIO_LATENCY.time():
+            message = client.messages.create(body=body, from_=from_number, to=phone)
+    except Exception as e:
+        # TwilioRestException carries the HTTP status
+        TWILIO_RESPONSES.inc(status=getattr(e, "status", "error"))
+        raise
+    TWILIO_RESPONSES.inc(status=201)
+    return {"sid": message.sid, "status": message.status}
+
+# SEND (phone, body) JOBS CONCURRENTLY, ONE RESULT PER JOB (SEE dispatch)
+def send_sms_batch(jobs, max_in_flight=MAX_IN_FLIGHT, on_result=None):
+    return dispatch(send_sms, jobs, max_in_flight, on_result)
@@ -0,0 +1,157 @@
+import os
+import json
+from string import Formatter
+from functools import reduce, lru_cache
+import pandas as pd
+
+# MESSAGE TEMPLATES, PARSED ONCE AND RENDERED FOR A WHOLE FRAME AT A TIME
+# departments override the built-in texts in TEMPLATES_PATH (JSON), per kind and language:
+#   {"ia_marks": {"en": {"subject": "{subject}: {marks}/{max}", "max": {"default": 50, "Lab": 25}},
+#                 "kn": {"body": "...", "absent": "..."}},
+#    "message": {"en": {"body": "{message}\nCSE Department"}}}
+# fields are sheet columns ({Student Name}, {USN}) or values given by the sender
+# ({title}, {subjects}, {message}, {semesters}); a language without some key
+# takes it from DEFAULT_LANGUAGE
+
+TEMPLATES_PATH = os.environ.get("TEMPLATES_PATH", "templates.json")
+DEFAULT_LANGUAGE = os.environ.get("TEMPLATE_LANGUAGE", "en").lower()
+# optional roster column with each parent's language, e.g. "en" or "kn"
+LANGUAGE_COLUMN = "Language"
+
+DEFAULT_TEMPLATES = {
+    "ia_marks": {
+        "en": {
+            "body": "Dear Parent, \nThis message is regarding the {title} marks of your ward, {Student Name}.\n{subjects}\nThank you.",
+            # one line per subject ({subject}, {marks}, {max}), joined by separator
+            "subject": "{subject}: {marks}",
+            "absent": "{subject}: Absent",
+            "separator": "\n",
+            # maximum marks for {max}: one number, or {"default": 50, "<subject>": 25}
+            "max": None,
+            # marks cells that mean absent, besides blank cells
+            "absent_marks": ["AB", "A", "ABSENT"],
+        },
+    },
+    "circular": {"en": {"body": "Please find the attached circular."}},
+    "message": {"en": {"body": "{message}"}},
+}
+
+# ONE TEMPLATE STRING, SPLIT INTO LITERAL TEXT AND FIELDS WHEN CREATED
+class Template:
+    def __init__(self, text):
+        self.text = text
+        self.pieces = []
+        for literal, field, spec, _ in Formatter().parse(text):
+            if field == "" or (field is not None and field.isdigit()):
+                raise ValueError(f"Template fields need a name: {text!r}")
+            self.pieces.append((literal, field, spec))
+
+    # ONE STRING PER ROW OF data; values (scalars or Series aligned with data) come before columns
+    def render(self, data, **values):
+        rendered = ""
+        for literal, field, spec in self.pieces:
+            if literal:
+                rendered = rendered + literal
+            if field is None:
+                continue
+            if field in values:
+                value = values[field]
+            elif field in data.columns:
+                value = data[field]
+            else:
+                raise ValueError(f"Unknown field {{{field}}} in template {self.text!r}")
+            rendered = rendered + _text(value, spec)
+        if isinstance(rendered, str):
+            return pd.Series(rendered, index=data.index, dtype=object)
+        return rendered
+
+def _text(value, spec):
+    if isinstance(value, pd.Series):
+        if spec:
+            return value.map(lambda item: format(item, spec))
+        return value.astype(str)
+    return format(value, spec)
+
+# MARKS AS TEXT (WHOLE NUMBERS WITHOUT ".0") AND WHICH ROWS ARE ABSENT
+def _marks(column, absent_marks):
+    text = column.astype(str)
+    absent = column.isna() | text.str.strip().str.upper().isin(absent_marks)
+    if not pd.api.types.is_integer_dtype(column):
+        numbers = pd.to_numeric(column, errors="coerce")
+        whole = numbers.notna() & (numbers % 1 == 0)
+        if whole.any():
+            text = text.mask(whole, numbers[whole].astype("int64").astype(str))
+    return text, absent
+
+# THE TEMPLATES OF ONE KIND IN ONE LANGUAGE
+class MessageTemplate:
+    def __init__(self, spec):
+        self.body = Template(spec["body"])
+        self.subject = Template(spec.get("subject", "{subject}: {marks}"))
+        self.absent = Template(spec.get("absent", "{subject}: Absent"))
+        self.separator = spec.get("separator", "\n")
+        self.max = spec.get("max")
+        self.absent_marks = [str(mark).upper() for mark in spec.get("absent_marks", [])]
+
+    def max_marks(self, subject):
+        if isinstance(self.max, dict):
+            return self.max.get(subject, self.max.get("default", ""))
+        return "" if self.max is None else self.max
+
+    # EVERY SUBJECT LINE OF EVERY ROW, JOINED PER ROW
+    def subject_lines(self, data, subjects):
+        lines = []
+        for subject in subjects:
+            marks, absent = _marks(data[subject], self.absent_marks)
+            values = {"subject": subject, "marks": marks, "max": self.max_marks(subject)}
+            line = self.subject.render(data, **values)
+            if absent.any():
+                line = line.mask(absent, self.absent.render(data, **values))
+            lines.append(line)
+        if not lines:
+            return ""
+        return reduce(lambda a, b: a + self.separator + b, lines)
+
+    # subjects, when given, is a list of marks columns rendered into {subjects}
+    def render(self, data, subjects=None, **values):
+        if subjects is not None:
+            values["subjects"] = self.subject_lines(data, subjects)
+        return self.body.render(data, **values)
+
+# EVERY KIND AND LANGUAGE, BUILT-IN TEXTS WITH THE DEPARTMENT'S OVERRIDES ON TOP
+class Templates:
+    def __init__(self, overrides=None):
+        self.kinds = {}
+        for kind in set(DEFAULT_TEMPLATES) | set(overrides or {}):
+            specs = {language: dict(spec) for language, spec in DEFAULT_TEMPLATES.get(kind, {}).items()}
+            for language, spec in (overrides or {}).get(kind, {}).items():
+                specs.setdefault(language.lower(), {}).update(spec)
+            base = specs.get(DEFAULT_LANGUAGE, {})
+            self.kinds[kind] = {language: MessageTemplate({**base, **spec}) for language, spec in specs.items()}
+
+    # ONE MESSAGE PER ROW OF data, IN THE ROW'S LANGUAGE WHEN THE SHEET HAS A LANGUAGE COLUMN
+    # rows in a language without templates get DEFAULT_LANGUAGE
+    def render(self, kind, data, **values):
+        templates = self.kinds[kind]
+        default = templates.get(DEFAULT_LANGUAGE) or next(iter(templates.values()))
+        if LANGUAGE_COLUMN not in data.columns or len(templates) == 1:
+            return default.render(data, **values)
+        languages = data[LANGUAGE_COLUMN].astype("string").str.strip().str.lower()
+        languages = languages.where(languages.isin(list(templates)), DEFAULT_LANGUAGE).fillna(DEFAULT_LANGUAGE)
+        parts = []
+        for language in languages.unique():
+            rows = languages == language
+            row_values = {name: value[rows] if isinstance(value, pd.Series) else value for name, value in values.items()}
+            parts.append(templates.get(language, default).render(data[rows], **row_values))
+        return pd.concat(parts).reindex(data.index)
+
+# TEMPLATES FROM TEMPLATES_PATH, COMPILED AGAIN ONLY WHEN THE FILE CHANGES
+def get_templates(path=TEMPLATES_PATH):
+    return _load(path, os.path.getmtime(path) if os.path.exists(path) else None)
+
+@lru_cache(maxsize=4)
+def _load(path, mtime):
+    if mtime is None:
+        return Templates()
+    with open(path, encoding="utf-8") as f:
+        return Templates(json.load(f))
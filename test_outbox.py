@@ -0,0 +1,91 @@
+import time
+import threading
+from outbox import Outbox, OutboxLease, OutboxWorker, LEASE_TIMEOUT
+from ledger import Ledger
+from scheduler import BulkPacer
+
+# OUTBOX SHARED BY SEVERAL PROCESSES, EACH ONE AN Outbox OF ITS OWN ON THE SAME FILE
+# python -m pytest -q
+
+JOBS = [(f"+91900000{i:04d}", f"Message {i}") for i in range(6)]
+
+# SEND FUNCTION RECORDING WHICH PROCESS SENT WHAT
+def recorder(sent, name):
+    lock = threading.Lock()
+
+    def send(phone, message, file_id=None):
+        with lock:
+            sent.append((name, phone))
+        return {"id": f"{name}-{phone}"}
+    return send
+
+# RUN WORKERS UNTIL EVERY BATCH IS DONE, THEN STOP THEM
+def drain(workers, outbox, batch_ids, timeout=10):
+    for worker in workers:
+        worker.start()
+    deadline = time.time() + timeout
+    while not all(outbox.progress(batch_id)["done"] for batch_id in batch_ids):
+        assert time.time() < deadline, "batch did not finish"
+        time.sleep(0.05)
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join()
+
+def test_only_the_lease_holder_claims(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    first, second = Outbox(path), Outbox(path)
+    first_lease, second_lease = OutboxLease(first, Ledger(path)), OutboxLease(second, Ledger(path))
+    first_lease.renew()
+    second_lease.renew()
+    assert first_lease.held.is_set()
+    assert not second_lease.held.is_set()
+
+    # queued by the process without the lease, sent by the holder
+    batch_id = second.enqueue("ia", JOBS)
+    sent = []
+    workers = [
+        OutboxWorker(outbox, recorder(sent, name), ledger=Ledger(path), pacer=BulkPacer(rate=0), lease=lease)
+        for outbox, name, lease in [(first, "first", first_lease), (second, "second", second_lease)]
+    ]
+    drain(workers, second, [batch_id])
+    assert sorted(sent) == sorted(("first", phone) for phone, _ in JOBS)
+    assert second.progress(batch_id)["sent"] == len(JOBS)
+
+def test_stale_lease_is_taken_over(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    dead, alive = Outbox(path), Outbox(path)
+    ledger = Ledger(path)
+    assert dead.take_lease()
+    batch_id = dead.enqueue("ia", JOBS)
+    # the holder claims and reserves, then stops renewing
+    rows = dead.claim(len(JOBS))
+    for row in rows:
+        assert ledger.reserve(row["batch_key"], row["phone"], "digest", dead.owner)
+    lease = OutboxLease(alive, Ledger(path))
+    lease.renew()
+    assert not lease.held.is_set()
+
+    with dead.lock:
+        dead.db.execute("UPDATE lease SET heartbeat = ?", (time.time() - LEASE_TIMEOUT - 1,))
+    lease.renew()
+    assert lease.held.is_set()
+    counts = alive.progress(batch_id)
+    assert counts["pending"] == len(JOBS) and counts["sending"] == 0
+    assert ledger.db.execute("SELECT COUNT(*) FROM ledger WHERE state = 'reserved'").fetchone()[0] == 0
+
+    # a late answer from the old holder does not touch the rows it lost
+    dead.complete(rows, [{"error": None, "response": None, "elapsed": 0.1}] * len(rows))
+    assert alive.progress(batch_id)["pending"] == len(JOBS)
+
+def test_same_batch_again_is_skipped(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    outbox = Outbox(path)
+    sent = []
+    first = outbox.enqueue("ia", JOBS)
+    drain([OutboxWorker(outbox, recorder(sent, "first"), ledger=Ledger(path), pacer=BulkPacer(rate=0))], outbox, [first])
+    # same jobs, so the same batch key
+    second = outbox.enqueue("ia", JOBS)
+    drain([OutboxWorker(outbox, recorder(sent, "second"), ledger=Ledger(path), pacer=BulkPacer(rate=0))], outbox, [second])
+    assert sorted(phone for _, phone in sent) == sorted(phone for phone, _ in JOBS)
+    assert outbox.progress(second)["skipped"] == len(JOBS)
@@ -1,16 +1,27 @@
-import os
 import pandas as pd
 import streamlit as st
-import pywhatkit as kit
-from twilio.rest import Client
+from render import render_ia_messages
+from phones import normalize_phone, preflight
+from dispatch import failed
+from sms import send_sms, send_sms_batch
+from whatsapp_web import WHATSAPP_DRIVER, get_web_driver, save_upload, pywhatkit
 
 @st.cache_data
 def send_whatsapp_image(image, students_info):
     data = pd.read_csv(students_info)
+    if WHATSAPP_DRIVER == "web":
+        image_path = save_upload(image)
     for i in data.index:
-        p_no = "+91" + str(data.loc[i, ['Parent Phone Number']].item())
+        p_no = normalize_phone(data.loc[i, ['Parent Phone Number']].item())
+        if pd.isna(p_no):
+            print(f"Skipping row {i + 2}: invalid phone number")
+            continue
         try: 
-            kit.sendwhats_image(p_no, image, wait_time = 45, tab_close = True, close_time= 15)
+            if WHATSAPP_DRIVER == "web":
+                #send through the shared WhatsApp Web session
+                get_web_driver().send_image(p_no, image_path)
+            else:
+                pywhatkit().sendwhats_image(p_no, image, wait_time = 45, tab_close = True, close_time= 15)
         except Exception as e:
             print(f'Failed to send message to {p_no}. Error: {e}')
     return
@@ -19,27 +30,19 @@ def send_whatsapp_image(image, students_info):
 def send_message(name, message, phone_no, service):
     if service == "WHATSAPP":
         try:
-            #send message using PyWhatKit
-            kit.sendwhatmsg_instantly(phone_no, message, wait_time=32, tab_close=True, close_time=15)
+            if WHATSAPP_DRIVER == "web":
+                #send through the shared WhatsApp Web session
+                get_web_driver().send_message(phone_no, message)
+            else:
+                #send message using PyWhatKit
+                pywhatkit().sendwhatmsg_instantly(phone_no, message, wait_time=32, tab_close=True, close_time=15)
             return
         except Exception as e:
             print(f"Failed to send message to {name}. Error: {e}")
     elif service == "SMS":
-        account_sid = os.environ["TWILIO_ACCOUNT_SID"]
-        auth_token = os.environ["TWILIO_AUTH_TOKEN"]
-        from_number = os.environ["TWILIO_PHONE_NUMBER"]
-        
-        # validate environment variables
-        if not all([account_sid, auth_token, from_number]):
-            print("Missing Twilio credentials in environment variables.")
-        client = Client(account_sid, auth_token)
         try:
-            message = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=phone_no,
-            )
-            
+            #send message using the shared Twilio client
+            send_sms(phone_no, message)
         except Exception as e:
             print(f'Failed to send message to {name}. Error: {e}')
     else:
@@ -52,36 +55,37 @@ def send_ia_marks(marks, students_info):
     df_marks = pd.read_csv(marks) 
     df_students_info = pd.read_csv(students_info)
 
+    #rows without a valid phone number are reported and left out before sending
+    #(checked before the merge, so the reported rows are the students file's)
+    df_students_info, problems = preflight(df_students_info, dedupe=["USN"])
+    for problem in problems.itertuples():
+        print(f"Skipping row {problem.row} ({problem.value}): {problem.problem}")
+
     #merge the dataframes using USN as key
     data = pd.merge(df_students_info, df_marks, on="USN")
 
     #get list of subjects
     subjects = data.columns[4:].tolist()
 
-    #iterate through each student's data
-    for i in df_marks.index: 
-        #get each student's information
-        name = data.loc[i, ['Student Name']].item()
-        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
-        service = data.loc[i, ['Preferred Service']].item()
-        student_marks = []
-        #add marks of each subject to the list
-        for j in subjects:
-            student_marks.append(data.loc[i,j])
-
-        message = f'Dear Parent, \nThis message is regarding the IA marks of your ward, {name}.\n'
-        message += '\n'.join([f'{subject}: {marks}' for subject, marks in zip(subjects, student_marks)])
-        message += '\nThank you.'
+    #build every student's message in one pass over the merged data
+    rendered = render_ia_messages(data, subjects, "IA")
 
+    #SMS parents are sent concurrently, collecting a status per message
+    sms = (data['Preferred Service'] == "SMS").to_numpy()
+    results = send_sms_batch(zip(rendered['phone'][sms], rendered['body'][sms]))
+    for result in failed(results):
+        print(f"Failed to send SMS to {result['phone']}. Error: {result['error']}")
+
+    for name, message, p_no, service in zip(data['Student Name'][~sms], rendered['body'][~sms], rendered['phone'][~sms], data['Preferred Service'][~sms]):
         send_message(name, message, p_no, service)
-    return
+    return results
 
 @st.cache_data
 def message_student(student_name, students_info, message):
     #read the csv files into dataframes
     df_students_info = pd.read_csv(students_info)
     try:
-        p_no = p_no = "+91" + str(df_students_info.loc[df_students_info['Student Name'] == student_name, 'Phone Number'].values[0])
+        p_no = normalize_phone(df_students_info.loc[df_students_info['Student Name'] == student_name, 'Phone Number'].values[0])
     except Exception as e:
         st.error(f"Error: {str(e)}")
     service = df_students_info.loc[df_students_info['Student Name'] == student_name, 'Preferred Service'].values[0]
@@ -136,7 +140,10 @@ def send_ia_ui():
     if st.button('Send IA Marks to Parents'):
         with st.spinner('Sending marks to parents...'):
             try:
-                send_ia_marks(marks_file, students_file)
+                results = send_ia_marks(marks_file, students_file)
+                if failed(results):
+                    st.error(f"Failed to send {len(failed(results))} of {len(results)} SMS messages.")
+                    st.dataframe(pd.DataFrame(failed(results), columns=['phone', 'error']))
                 st.success(f"Successfully sent {ia} marks to parents for Semester {semester_no}")
                 return
             except Exception as e:
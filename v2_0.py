@@ -1,16 +1,24 @@
 import os
 import pandas as pd
 import streamlit as st
-import pywhatkit as kit
-from twilio.rest import Client
+from render import render_ia_messages
+from phones import normalize_phone, preflight
+from dispatch import failed
+from broadcast import BroadcastPlan
+from sms import send_sms, send_sms_batch
+from whatsapp_web import WHATSAPP_DRIVER, get_web_driver, save_upload, pywhatkit
 
 @st.cache_data
-def send_whatsapp_image(image, students_info):
-    data = pd.read_csv(students_info)
-    for i in data.index:
-        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
+def send_whatsapp_image(image, phones):
+    if WHATSAPP_DRIVER == "web":
+        image_path = save_upload(image)
+    for p_no in phones:
         try: 
-            kit.sendwhats_image(p_no, image, wait_time = 45, tab_close = True, close_time= 15)
+            if WHATSAPP_DRIVER == "web":
+                #send through the shared WhatsApp Web session
+                get_web_driver().send_image(p_no, image_path)
+            else:
+                pywhatkit().sendwhats_image(p_no, image, wait_time = 45, tab_close = True, close_time= 15)
         except Exception as e:
             print(f'Failed to send message to {p_no}. Error: {e}')
     return
@@ -19,25 +27,18 @@ def send_whatsapp_image(image, students_info):
 def send_message(name, message, phone_no, service):
     if service == "WHATSAPP":
         try:
-            #send message using PyWhatKit
-            kit.sendwhatmsg_instantly(phone_no, message, wait_time=32, tab_close=True, close_time=15)
+            if WHATSAPP_DRIVER == "web":
+                #send through the shared WhatsApp Web session
+                get_web_driver().send_message(phone_no, message)
+            else:
+                #send message using PyWhatKit
+                pywhatkit().sendwhatmsg_instantly(phone_no, message, wait_time=32, tab_close=True, close_time=15)
         except Exception as e:
             print(f"Failed to send message to {name}. Error: {e}")
     elif service == "SMS":
-        account_sid = os.environ["TWILIO_ACCOUNT_SID"]
-        auth_token = os.environ["TWILIO_AUTH_TOKEN"]
-        from_number = os.environ["TWILIO_PHONE_NUMBER"]
-        
-        # validate environment variables
-        if not all([account_sid, auth_token, from_number]):
-            print("Missing Twilio credentials in environment variables.")
-        client = Client(account_sid, auth_token)
         try:
-            message = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=phone_no,
-            )
+            #send message using the shared Twilio client
+            send_sms(phone_no, message)
         except Exception as e:
             print(f'Failed to send message to {name}. Error: {e}')
     else:
@@ -49,34 +50,35 @@ def send_ia_marks(marks, students_info):
     df_marks = pd.read_csv(marks) 
     df_students_info = pd.read_csv(students_info)
 
+    #rows without a valid phone number are reported and left out before sending
+    #(checked before the merge, so the reported rows are the students file's)
+    df_students_info, problems = preflight(df_students_info, dedupe=["USN"])
+    for problem in problems.itertuples():
+        print(f"Skipping row {problem.row} ({problem.value}): {problem.problem}")
+
     #merge the dataframes using USN as key
     data = pd.merge(df_students_info, df_marks, on="USN")
 
     #get list of subjects
     subjects = data.columns[4:].tolist()
 
-    #iterate through each student's data
-    for i in df_marks.index: 
-        #get each student's information
-        name = data.loc[i, ['Student Name']].item()
-        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
-        service = data.loc[i, ['Preferred Service']].item()
-        student_marks = []
-        #add marks of each subject to the list
-        for j in subjects:
-            student_marks.append(data.loc[i,j])
-
-        message = f'Dear Parent, \nThis message is regarding the IA marks of your ward, {name}.\n'
-        message += '\n'.join([f'{subject}: {marks}' for subject, marks in zip(subjects, student_marks)])
-        message += '\nThank you.'
+    #build every student's message in one pass over the merged data
+    rendered = render_ia_messages(data, subjects, "IA")
+
+    #SMS parents are sent concurrently, collecting a status per message
+    sms = (data['Preferred Service'] == "SMS").to_numpy()
+    results = send_sms_batch(zip(rendered['phone'][sms], rendered['body'][sms]))
+    for result in failed(results):
+        print(f"Failed to send SMS to {result['phone']}. Error: {result['error']}")
 
+    for name, message, p_no, service in zip(data['Student Name'][~sms], rendered['body'][~sms], rendered['phone'][~sms], data['Preferred Service'][~sms]):
         send_message(name, message, p_no, service)
-    return
+    return results
 
 def message_student(student_name, students_info, message):
     #read the csv files into dataframes
     df_students_info = pd.read_csv(students_info)
-    p_no = p_no = "+91" + str(df_students_info.loc[df_students_info['Student Name'] == student_name, 'Phone Number'].values[0])
+    p_no = normalize_phone(df_students_info.loc[df_students_info['Student Name'] == student_name, 'Phone Number'].values[0])
     service = df_students_info.loc[df_students_info['Student Name'] == student_name, 'Preferred Service'].values[0]
     send_message(student_name, message, p_no, service)
     return 
@@ -90,20 +92,28 @@ def send_circular_ui():
     else:
         semester_no = st.multiselect('Select One or More Semesters: ', [2, 4, 6, 8])
     
+    files = {}
     for sem_no in semester_no:
         students_file = os.path.join('data/student_details_sem_' + str(sem_no) + '.csv')
         if not os.path.exists(students_file):
             st.error(f"Student details file not found: {students_file}")
             return
-        
-        if st.button(f'Send Circular to Semester {sem_no} Parents'):
-            with st.spinner('Sending circular to parents...'):
-                try:
-                    send_whatsapp_image(img, students_file)
-                    st.success(f"Successfully sent circular to parents for Semester {sem_no}")
-                except Exception as e:
-                    st.error(f"Error sending circular: {str(e)}")
-                    continue
+        files[sem_no] = students_file
+    if not files:
+        return
+
+    #parents with children in several selected semesters get the circular once
+    plan = BroadcastPlan({sem_no: pd.read_csv(students_file) for sem_no, students_file in files.items()})
+    st.caption(plan.summary())
+    semesters_text = ", ".join(str(sem_no) for sem_no in files)
+
+    if st.button(f'Send Circular to Semester {semesters_text} Parents'):
+        with st.spinner('Sending circular to parents...'):
+            try:
+                send_whatsapp_image(img, plan.phones)
+                st.success(f"Successfully sent circular to parents for Semester {semesters_text}")
+            except Exception as e:
+                st.error(f"Error sending circular: {str(e)}")
         
 def send_message_ui():
     st.header("Message a Parent")
@@ -153,7 +163,10 @@ def send_ia_ui():
     if st.button('Send IA Marks to Parents'):
         with st.spinner('Sending marks to parents...'):
             try:
-                send_ia_marks(marks_file, students_file)
+                results = send_ia_marks(marks_file, students_file)
+                if failed(results):
+                    st.error(f"Failed to send {len(failed(results))} of {len(results)} SMS messages.")
+                    st.dataframe(pd.DataFrame(failed(results), columns=['phone', 'error']))
                 st.success(f"Successfully sent {ia.replace('_', ' ').upper()} marks to parents for Semester {semester_no}")
             except Exception as e:
                 st.error(f"Error sending marks: {str(e)}")
@@ -1,117 +1,86 @@
-import os
-import requests
+from datetime import datetime, timedelta
 import pandas as pd
 import streamlit as st
-from pathlib import Path
-
-# API ENVIRONMENT VARIABLES & URLS 
-
-WASSENGER_API_KEY = os.environ["WASSENGER_API"]
-WASSENGER_MSG_URL = "https://api.wassenger.com/v1/messages"
-WASSENGER_FILE_URL = "https://api.wassenger.com/v1/files"
-
-HEADERS = {
-    "Content-Type": "application/json",
-    "Token": WASSENGER_API_KEY
-}
-
-# MAIN API CALL 
-@st.cache_data
-def send_whatsapp_message(phone, message):
-    payload = {
-        "phone": phone,
-        "message": message
-    }
-    try:
-        response = requests.post(WASSENGER_MSG_URL, json=payload, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        st.error(f"Failed to send message to {phone}. Error: {e}")
-        return None
-    
-# UPLOAD IMAGE TO WASSENGER, RETURN FILE ID
-@st.cache_data
-def upload_image_to_wassenger(image_file):
-    headers = {"Token": WASSENGER_API_KEY}
-    files = {"file": (image_file.name, image_file, image_file.type)}
-    try:
-        response = requests.post(WASSENGER_FILE_URL, headers=headers, files=files)
-        response.raise_for_status()
-        file_id = response.json()[0]["id"]
-        return file_id
-    except Exception as e:
-        print(f"Failed to upload image. Error: {e}")
+from messaging import (
+    get_outbox, get_worker, get_delivery_tracker, get_metrics_server, get_file_catalog,
+    read_index, read_workbook, plan_ia_marks, send_ia_marks, plan_circular, send_whatsapp_image, message_student,
+)
+from progress import progress_text
+import metrics
+from profiling import PROFILE, profiled, summaries
+from scheduler import PRIORITY_MESSAGE, SEND_HOURS, parse_hours, next_allowed
+from ratelimit import limiter_states
+
+# STREAMLIT UI: REMEMBER A QUEUED BATCH SO ITS PROGRESS IS SHOWN ACROSS RERUNS
+def track_batch(batch_id):
+    if 'batches' not in st.session_state:
+        st.session_state.batches = []
+    st.session_state.batches.insert(0, batch_id)
+
+# STREAMLIT UI: PROGRESS, THROUGHPUT AND ETA OF THIS SESSION'S BATCHES, POLLED FROM THE OUTBOX
+@st.fragment(run_every=1)
+def show_batch_progress():
+    outbox = get_outbox()
+    for batch_id in st.session_state.get('batches', []):
+        batch = outbox.batch(batch_id)
+        if batch is None:
+            continue
+        progress = outbox.progress(batch_id)
+        done = progress['sent'] + progress['skipped'] + progress['failed']
+        st.progress(done / max(progress['total'], 1), text=progress_text(batch['label'], progress))
+        # bulk batches wait for their send time and the sending hours
+        if batch['priority'] < PRIORITY_MESSAGE and progress['pending']:
+            now = datetime.now().timestamp()
+            start = next_allowed(max(batch['send_at'] or 0, now), parse_hours(SEND_HOURS))
+            if start > now:
+                st.caption(f"Starts {datetime.fromtimestamp(start):%d %b %Y, %H:%M}")
+        if progress['sent']:
+            deliveries = outbox.deliveries(batch_id)
+            st.caption(f"Delivery: {deliveries['delivered']} delivered, {deliveries['read']} read, {deliveries['failed']} failed, {deliveries['sent'] + deliveries['unknown']} awaiting receipt")
+        # failures are written back while the batch is still sending
+        if progress['failed']:
+            st.dataframe(pd.DataFrame(outbox.failures(batch_id), columns=["phone", "error"]))
+
+# STREAMLIT UI: OPTIONAL LATER START FOR A BULK BATCH, RETURNS A TIMESTAMP OR NONE
+def schedule_input():
+    hours = parse_hours(SEND_HOURS)
+    if hours:
+        st.caption(f"Bulk messages are only sent between {SEND_HOURS.replace('-', ' and ')}.")
+    if not st.checkbox('Schedule for later'):
         return None
-
-# API CALL TO SEND MESSAGE WITH IMAGE
-@st.cache_data
-def send_whatsapp_image_message(phone, message, file_id):
-    payload = {
-        "phone": phone,
-        "message": message,
-        "media": {"file": file_id}
-    }
+    now = datetime.now()
+    # defaults to the next full hour
+    default = (now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    day = st.date_input('Send on', value=default.date(), min_value=now.date())
+    at = st.time_input('Send at', value=default.time())
+    send_at = datetime.combine(day, at).timestamp()
+    start = next_allowed(max(send_at, now.timestamp()), hours)
+    st.caption(f"Sending starts {datetime.fromtimestamp(start):%d %b %Y, %H:%M}.")
+    return send_at
+
+# STREAMLIT UI: SHEETS AND ROW COUNTS OF A SELECTED AUTO LOAD FILE
+def show_file_details(path):
+    if isinstance(path, str):
+        sheets = get_file_catalog().describe(path)
+        if sheets:
+            st.caption(", ".join(f"{name}: {rows} rows" for name, rows in sheets.items()))
+
+# STREAMLIT UI: PARSE EVERY SHEET OF A WORKBOOK ONCE AND REPORT LAYOUT PROBLEMS
+def load_workbook(workbook):
     try:
-        response = requests.post(WASSENGER_MSG_URL, json=payload, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        loaded = read_workbook(workbook)
     except Exception as e:
-        print(f"Failed to send image to {phone}. Error: {e}")
+        st.error(f"Could not read {getattr(workbook, 'name', workbook)}: {e}")
         return None
+    for problem in loaded.problems:
+        st.warning(problem)
+    return loaded
 
-# FUNCTION TO SEND IA MARKS TO PARENTS
-@st.cache_data
-def send_ia_marks(students_info, marks, ia):
-    df_students_info = pd.read_excel(students_info)
-    df_marks = pd.read_excel(marks, sheet_name = 'IA ' + str(ia))
-    
-    data = pd.merge(df_students_info, df_marks, on="USN")
-    subjects = data.columns[3:].tolist() # this is assuming the user has followed the excel format instructions
-    for i in df_marks.index:
-        # reading individual's information from the file
-        name = data.loc[i, ['Student Name']].item()
-        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
-        student_marks = [data.loc[i, j] for j in subjects]
-
-        # message template for IA marks
-        message = f'Dear Parent, \nThis message is regarding the I.A. {ia} marks of your ward, {name}.\n'
-        message += '\n'.join([f'{subject}: {marks}' for subject, marks in zip(subjects, student_marks)])
-        message += '\nThank you.'
-
-        response = send_whatsapp_message(p_no, message)
-    return response
-
-# FUNCTION TO SEND CIRCULAR TO PARENTS
-@st.cache_data
-def send_whatsapp_image(students_info, image):
-    data = pd.read_excel(students_info, )
-    file_id = upload_image_to_wassenger(image)
-
-    if not file_id:
-        print("Image upload failed. Aborting.")
-        return
-    
-    for i in data.index:
-        p_no = "+91" + str(data.loc[i, ['Phone Number']].item())
-        send_whatsapp_image_message(p_no, "Please find the attached circular.", file_id)
-    return
-
-# FUNCTION TO SEND MESSAGE TO SINGLE PARENT
-@st.cache_data
-def message_student(students_info, message, semester_no, student_usn = None, student_name = None):
-    df_students_info = pd.read_excel(students_info, sheet_name='sem ' + str(semester_no))
-    try:
-        if (student_name):
-            p_no = "+91" + str(df_students_info.loc[df_students_info['Student Name'] == student_name, 'Phone Number'].values[0])
-            st.info(p_no)
-        elif (student_usn):
-            p_no = "+91" + str(df_students_info.loc[df_students_info['USN'] == student_usn, 'Phone Number'].values[0])
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
-        return
-    send_whatsapp_message(p_no, message)
-    return
+# STREAMLIT UI: ROWS THAT WILL NOT BE MESSAGED BECAUSE OF THEIR PHONE NUMBER
+def show_phone_problems(problems):
+    if len(problems):
+        st.warning(f"{len(problems)} row(s) will be skipped, fix their phone numbers in the sheet to include them.")
+        st.dataframe(problems, hide_index=True)
 
 # STREAMLIT UI: SEND IA MARKS
 def send_ia_ui():
@@ -130,28 +99,41 @@ def send_ia_ui():
         students_file = st.file_uploader(f"Upload File for {semester_no} Semester Students' Information:")
         marks_file = st.file_uploader(f"Upload File for {semester_no} Semester's IA  Marks:")    
     else:
-        pathlist = Path().rglob('*.xlsx')
-        string_paths = []
-        for path in pathlist:
-            # convert path from object to string
-            path_in_str = str(path)
-            string_paths.append(path_in_str)
+        string_paths = get_file_catalog().paths()
         students_file = st.selectbox(f"Select File for {semester_no} Semester Students' Information:", string_paths)
+        show_file_details(students_file)
         marks_file = st.selectbox(f"Select File for {semester_no} Semester's IA Marks:", string_paths)
+        show_file_details(marks_file)
 
     for i in range(len(ia_num)):
         if ia_num[i].isnumeric():
             ia = int(ia_num[i])
+
+    if marks_file is not None:
+        marks_workbook = load_workbook(marks_file)
+        if marks_workbook is not None and ia not in marks_workbook.ias:
+            st.warning(f"The marks file has no 'IA {ia}' sheet.")
+        elif marks_workbook is not None and students_file is not None:
+            try:
+                data, _, problems = plan_ia_marks(students_file, marks_file, ia)
+            except Exception as e:
+                st.error(f"Could not match students with marks: {e}")
+            else:
+                st.caption(f"{len(data)} students with a valid parent phone number")
+                show_phone_problems(problems)
     
+    resend = st.checkbox('Send again to parents who already received these marks')
+    send_at = schedule_input()
     if st.button('Send IA Marks to Parents'):
         with st.spinner('Sending marks to parents...'):
             try:    
-                response = send_ia_marks(students_file, marks_file, ia)
+                batch_id = send_ia_marks(students_file, marks_file, ia, resend, send_at)
             except Exception as e:
                 st.error(f"Error sending marks: {str(e)}")
                 return
-        if response:
-            st.success(f"Successfully sent I.A. {ia} marks to parents for Semester {semester_no}")
+        if batch_id:
+            track_batch(batch_id)
+            st.success(f"Queued I.A. {ia} marks for parents of Semester {semester_no}")
         else:
             return
 
@@ -162,33 +144,46 @@ def send_circular_ui():
     img = st.file_uploader('Upload Circular (jpg, jpeg, or png)', type=['jpg', 'jpeg', 'png'])
     semester = st.selectbox('Odd or Even Semester?', ['Odd', 'Even'])
     if semester == "Odd":
-        semester_no = st.selectbox('Select Semester: ', [1, 3, 5, 7 ])
+        semester_no = st.multiselect('Select One or More Semesters: ', [1, 3, 5, 7 ])
     else:
-        semester_no = st.selectbox('Select Semester: ', [2, 4, 6, 8])
+        semester_no = st.multiselect('Select One or More Semesters: ', [2, 4, 6, 8])
+    semesters_text = ", ".join(str(sem_no) for sem_no in semester_no)
 
     option = st.selectbox('Upload or auto load files?', ['Auto Load', 'Upload'])
 
     if (option == 'Upload'):
-        students_file = st.file_uploader(f"Upload File for {semester_no} Semester Students' Information:")
+        students_file = st.file_uploader("Upload File with the Selected Semesters' Student Information:")
     else:
-        pathlist = Path().rglob('*.xlsx')
-        stringpath = []
-        for path in pathlist:
-            # convert path from object to string and append in list
-            path_in_str = str(path)
-            stringpath.append(path_in_str)
-            
-        students_file = st.selectbox(f"Select File for {semester_no} Semester Students' Information:", stringpath, index = None)
-    
+        stringpath = get_file_catalog().paths()
+        students_file = st.selectbox("Select File with the Selected Semesters' Student Information:", stringpath, index = None)
+        show_file_details(students_file)
 
-    if st.button(f'Send Circular to Semester {semester_no} Parents'):
+    if students_file is None or not semester_no:
+        st.info("Select one or more semesters and the students file.")
+        return
+    workbook = load_workbook(students_file)
+    if workbook is None:
+        return
+    missing = [sem_no for sem_no in semester_no if sem_no not in workbook.semesters]
+    if missing:
+        st.error(f"The selected file has no sheet for Semester {', '.join(str(sem_no) for sem_no in missing)}.")
+        return
+    # parents with children in several selected semesters get the circular once
+    plan = plan_circular(students_file, semester_no)
+    st.caption(plan.summary())
+    show_phone_problems(plan.problems)
+
+    resend = st.checkbox('Send again to parents who already received this circular')
+    send_at = schedule_input()
+    if st.button(f'Send Circular to Semester {semesters_text} Parents'):
         with st.spinner('Sending Circular to Parents...'):
             try:
-                send_whatsapp_image(students_file, img)
+                batch_id = send_whatsapp_image(students_file, img, semester_no, resend, send_at)
             except Exception as e:
                 st.error(f"Error Sending Circular: {str(e)}")
                 return
-        st.success(f"Successfully Sent Circular to Parents for Semester {semester_no}")
+        track_batch(batch_id)
+        st.success(f"Queued Circular for Parents of Semester {semesters_text}")
         return
 
 # STREAMLIT UI: SEND SINGLE MESSAGE
@@ -206,16 +201,22 @@ def send_message_ui():
     if (option == 'Upload'):
         students_file = st.file_uploader(f"Upload File for {semester_no} Semester Students' Information:")
     else:
-        pathlist = Path().rglob('*.xlsx')
-        string_paths = []
-        for path in pathlist:
-            # convert path from object to string
-            path_in_str = str(path)
-            string_paths.append(path_in_str)
+        string_paths = get_file_catalog().paths()
         students_file = st.selectbox(f"Select File for {semester_no} Semester Students' Information:", string_paths, index = None)
+        show_file_details(students_file)
 
     if students_file is not None:
-        students_data = pd.read_excel(students_file, sheet_name= 'sem ' + str(semester_no))
+        workbook = load_workbook(students_file)
+        if workbook is None:
+            return
+        if semester_no not in workbook.semesters:
+            st.error(f"The selected file has no 'sem {semester_no}' sheet.")
+            return
+        # switching semester is a lookup in the already parsed workbook
+        students_data = workbook.semester(semester_no)
+        students_index = read_index(students_file, sheet_name= 'sem ' + str(semester_no))
+        if students_index.duplicate_usns:
+            st.warning(f"Duplicate USNs in this sheet: {', '.join(sorted(students_index.duplicate_usns))}")
 
         option = st.selectbox('Find Student by USN or Name?', ['USN', 'Name'])
         student_USN = None
@@ -223,8 +224,12 @@ def send_message_ui():
             if option == "USN":
                 USN_list = students_data['USN'].values.tolist()
                 student_USN = st.selectbox("Select Student's USN: ", USN_list)
-                student_name = students_data.loc[students_data['USN'] == student_USN, 'Student Name'].values[0]
+                student_name = students_index.by_usn(student_USN)['Student Name']
             else: 
+                # a name shared by several students cannot pick one parent, message_student refuses it
+                if students_index.duplicate_names:
+                    shared = sorted(str(students_index.by_name(name)[0]['Student Name']) for name in students_index.duplicate_names)
+                    st.warning(f"Several students share these names, find them by USN: {', '.join(shared)}")
                 names_list = students_data['Student Name'].values.tolist()
                 student_name = st.selectbox("Select Student's Name:", names_list)
             message = st.text_input("Enter the Message to be Sent:")
@@ -232,13 +237,15 @@ def send_message_ui():
                 with st.spinner('Sending message to parents...'):
                     try:
                         if (student_USN) :
-                            message_student(students_file, message, semester_no, student_USN)
+                            batch_id = message_student(students_file, message, semester_no, student_usn=student_USN)
                         else: 
-                            message_student(students_file, message, semester_no, student_name)
+                            batch_id = message_student(students_file, message, semester_no, student_name=student_name)
                     except Exception as e:
                         st.error(f"Error sending message: {str(e)}")
                         return
-                st.success(f"Successfully sent message to {student_name}'s parents.")
+                if batch_id:
+                    track_batch(batch_id)
+                    st.success(f"Queued message to {student_name}'s parents.")
                 return
         except Exception as e:
             st.error(f"Error in selected file: {e}")
@@ -247,6 +254,37 @@ def send_message_ui():
     else:
         st.error("Please Select a File")
 
+# STREAMLIT UI: REQUEST LATENCIES, RESPONSE CODES, BATCH SIZES AND PARSE TIMES
+def metrics_ui():
+    st.header("Metrics")
+    rows = metrics.rows()
+    if not rows:
+        st.info("Nothing recorded since the server started.")
+        return
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+    with st.expander("Prometheus text format"):
+        st.code(metrics.render(), language="text")
+
+# STREAMLIT UI: HOT FUNCTIONS OF THE LATEST PROFILED RERUNS AND SENDS (PROFILE=1)
+def profiles_ui():
+    st.header("Profiles")
+    recent = summaries()
+    if not recent:
+        st.info("No profiles recorded yet.")
+        return
+    for summary in recent:
+        with st.expander(f"{summary['name']}: {summary['seconds']:.3f}s"):
+            st.caption(summary['path'])
+            st.dataframe(pd.DataFrame(summary['top']), hide_index=True)
+
+# STREAMLIT UI: CURRENT PROVIDER RATE LIMITS
+def show_limiter_state():
+    states = limiter_states()
+    if states:
+        st.sidebar.subheader("Provider Rate Limits")
+        for key, state in states.items():
+            st.sidebar.caption(f"{key}: {state['rate']} msg/s, {state['queue_depth']} queued, {state['throttled']} throttled")
+
 # STREAMLIT MAIN FUNCTION
 
 st.set_page_config(
@@ -260,11 +298,17 @@ if 'host_url' not in st.session_state:
     st.session_state.host_url = "http://localhost:8501"
 
 def main():
+    get_worker()
+    get_delivery_tracker()
+    get_metrics_server()
     st.title("Student Messaging Application")
     st.sidebar.title("Navigation")
+    pages = ["Send I.A. Marks", "Circular", "Message a Parent", "Metrics"]
+    if PROFILE:
+        pages.append("Profiles")
     page = st.sidebar.radio(
         "Select a function:",
-        ["Send I.A. Marks", "Circular", "Message a Parent"]
+        pages
     )
     if page == "Send I.A. Marks":
         send_ia_ui()
@@ -272,10 +316,18 @@ def main():
         send_circular_ui()
     elif page == "Message a Parent":
         send_message_ui()
+    elif page == "Metrics":
+        metrics_ui()
+    elif page == "Profiles":
+        profiles_ui()
+    show_batch_progress()
+    show_limiter_state()
     st.markdown("---")
     st.info(
         "This tool helps professors to easily send batch or single messages to their students."
     )
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # one profile per rerun when PROFILE=1
+    with profiled("rerun"):
+        main()
@@ -0,0 +1,183 @@
+import os
+import threading
+from urllib.parse import quote
+
+# ONE LOGGED-IN WHATSAPP WEB TAB THAT MESSAGES ARE SENT THROUGH ONE AFTER
+# ANOTHER, WAITING ON PAGE STATE INSTEAD OF pywhatkit'S FIXED SLEEPS AND NEW TABS
+# needs selenium and Chrome; the login (QR scan) is kept in PROFILE_DIR
+
+# "web" sends through this driver, anything else keeps pywhatkit
+WHATSAPP_DRIVER = os.environ.get("WHATSAPP_DRIVER", "pywhatkit")
+WHATSAPP_WEB_URL = os.environ.get("WHATSAPP_WEB_URL", "https://web.whatsapp.com")
+PROFILE_DIR = os.environ.get("WHATSAPP_PROFILE_DIR", ".whatsapp_profile")
+# seconds to wait for the QR code to be scanned on first use
+LOGIN_TIMEOUT = 180
+# seconds to wait for a chat to open or a message to leave the compose box
+TIMEOUT = 30
+# seconds between checks of the page while waiting (selenium's default is 0.5)
+POLL = 0.05
+
+# PAGE READINESS SIGNALS (WhatsApp Web markup, mirrored by whatsapp_web_standin.html)
+SELECTORS = {
+    "ready": "#pane-side",
+    "compose": "footer div[contenteditable='true']",
+    "send": "span[data-icon='send']",
+    "invalid": "div[data-animate-modal-popup='true']",
+    "attach": "input[type='file'][accept*='image']",
+    # the media preview opened by an attachment has its own caption box, outside the chat footer
+    "caption": "div[contenteditable='true']:not(footer *)",
+    "media_send": "div[role='button'] span[data-icon='send'], span[data-icon='wds-ic-send-filled']",
+    "sent": "div.message-out span[data-icon='msg-check'], div.message-out span[data-icon='msg-dblcheck']",
+}
+
+class WhatsAppWebDriver:
+    def __init__(self, base_url=WHATSAPP_WEB_URL, profile_dir=PROFILE_DIR, headless=False, timeout=TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.profile_dir = os.path.abspath(profile_dir)
+        self.headless = headless
+        self.timeout = timeout
+        self.browser = None
+        # the browser session handles one chat at a time
+        self.lock = threading.Lock()
+
+    def start(self, login_timeout=LOGIN_TIMEOUT):
+        from selenium import webdriver
+
+        options = webdriver.ChromeOptions()
+        options.add_argument(f"--user-data-dir={self.profile_dir}")
+        if self.headless:
+            options.add_argument("--headless=new")
+        self.browser = webdriver.Chrome(options=options)
+        self.browser.get(self.base_url)
+        self._wait("ready", login_timeout)
+        return self
+
+    def close(self):
+        if self.browser is not None:
+            self.browser.quit()
+            self.browser = None
+
+    def _wait(self, name, timeout=None, clickable=False):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        locator = (By.CSS_SELECTOR, SELECTORS[name])
+        condition = EC.element_to_be_clickable(locator) if clickable else EC.presence_of_element_located(locator)
+        return WebDriverWait(self.browser, timeout or self.timeout, poll_frequency=POLL).until(condition)
+
+    def _count(self, name):
+        from selenium.webdriver.common.by import By
+        return len(self.browser.find_elements(By.CSS_SELECTOR, SELECTORS[name]))
+
+    # OPEN A CHAT BY LOADING ITS /send URL IN THE SAME TAB: A FULL PAGE LOAD, BUT
+    # THE LOGIN IS KEPT AND NOTHING WAITS LONGER THAN THE PAGE NEEDS
+    def _open_chat(self, phone, text=""):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        self.browser.get(f"{self.base_url}/send?phone={quote(phone.lstrip('+'))}&text={quote(text)}")
+        try:
+            # the app is loaded again first, then it opens the chat
+            self._wait("ready")
+            WebDriverWait(self.browser, self.timeout, poll_frequency=POLL).until(
+                lambda browser: self._count("compose") or self._count("invalid")
+            )
+        except TimeoutException:
+            raise TimeoutError(f"Chat with {phone} did not open.")
+        if self._count("invalid"):
+            raise ValueError(f"{phone} is not on WhatsApp.")
+
+    # WAIT UNTIL ONE MORE OUTGOING MESSAGE SHOWS A SENT TICK
+    def _wait_sent(self, before):
+        from selenium.webdriver.support.ui import WebDriverWait
+        WebDriverWait(self.browser, self.timeout, poll_frequency=POLL).until(lambda browser: self._count("sent") > before)
+
+    def send_message(self, phone, message):
+        with self.lock:
+            self._open_chat(phone, message)
+            before = self._count("sent")
+            self._wait("send", clickable=True).click()
+            self._wait_sent(before)
+        return {"phone": phone, "status": "sent"}
+
+    def send_image(self, phone, image_path, caption=""):
+        with self.lock:
+            self._open_chat(phone)
+            before = self._count("sent")
+            self._wait("attach").send_keys(os.path.abspath(image_path))
+            if caption:
+                self._wait("caption").send_keys(caption)
+            self._wait("media_send", clickable=True).click()
+            self._wait_sent(before)
+        return {"phone": phone, "status": "sent"}
+
+# WRITE AN st.file_uploader IMAGE TO A TEMPORARY FILE THE BROWSER CAN ATTACH
+def save_upload(upload):
+    import tempfile
+    suffix = os.path.splitext(getattr(upload, "name", ""))[1] or ".jpg"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(upload.getvalue())
+    return f.name
+
+# PROCESS-WIDE SESSION, STARTED ON FIRST USE
+
+_driver = None
+_driver_lock = threading.Lock()
+
+def get_web_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            _driver = WhatsAppWebDriver().start()
+        return _driver
+
+# pywhatkit IS ONLY IMPORTED WHEN A MESSAGE GOES THROUGH IT: IMPORTING IT LOADS
+# pyautogui AND ITS BROWSER AUTOMATION, AND FAILS OUTRIGHT ON A HEADLESS SERVER
+def pywhatkit():
+    import pywhatkit
+    return pywhatkit
+
+# CHECK AGAINST THE LOCAL STAND-IN PAGE: TIMES [messages] TEXT MESSAGES, THEN
+# SENDS ONE CAPTIONED IMAGE AND ONE MESSAGE TO A NUMBER NOT ON WHATSAPP
+# python whatsapp_web.py [messages]
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    standin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whatsapp_web_standin.html")
+
+    class StandinHandler(SimpleHTTPRequestHandler):
+        # every path (/, /send?...) serves the stand-in page
+        def translate_path(self, path):
+            return standin
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(StandinHandler, directory=os.path.dirname(standin)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    driver = WhatsAppWebDriver(f"http://127.0.0.1:{server.server_port}", tempfile.mkdtemp(), headless=True)
+    driver.start(login_timeout=10)
+    start = time.perf_counter()
+    for i in range(count):
+        driver.send_message(f"+91900000{i:04d}", f"Test message {i}")
+    elapsed = time.perf_counter() - start
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as image:
+        image.write(b"\x89PNG\r\n\x1a\n")
+    driver.send_image("+919000009999", image.name, "Test caption")
+    from selenium.webdriver.common.by import By
+    sent = [bubble.text for bubble in driver.browser.find_elements(By.CSS_SELECTOR, "div.message-out")]
+    try:
+        driver.send_message("+0001234567", "Not on WhatsApp")
+        invalid = "sent"
+    except ValueError:
+        invalid = "rejected"
+    driver.close()
+    server.shutdown()
+    print(f"{count} messages in {elapsed:.2f}s ({elapsed / count:.2f}s per message)")
+    print(f"image: {sent}, unknown number: {invalid}")